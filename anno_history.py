@@ -0,0 +1,167 @@
+# Undo/redo for scene annotations.
+# The annotation data keeps its pickle format ({ti: {"high_level": str, "lanes": {key: [lane, ...]}}})
+# but is treated as immutable: every edit below returns a new version that copies
+# only the path to the change (top dict -> keyframe -> lanes dict -> one track list)
+# and shares everything else, in particular the lane tuples and their point arrays.
+# A history step therefore costs a few small containers, not a copy of the geometry.
+
+LANE_KEYS = ["curr", "left", "right"]
+HIGH_LEVEL_OPTIONS = ["Lane-keeping", "Left-lane-change", "Right-lane-change", "Stop sign", "Traffic light"]
+LOCATION_LIST = ["boston-seaport", "singapore-hollandvillage", "singapore-queenstown", "singapore-onenorth"]
+
+
+def new_frame():
+    return {"high_level": None, "lanes": {"curr": [], "left": [], "right": []}}
+
+
+def new_annotation():
+    return {0: new_frame()}
+
+
+def proper_ti(data, ti):
+    # keyframe that applies at timestep ti (latest one at or before ti)
+    for tj in range(ti, -1, -1):
+        if tj in data:
+            return tj
+    return None
+
+
+def replace_frame(data, ti, frame):
+    new_data = dict(data)
+    new_data[ti] = frame
+    return new_data
+
+
+def set_high_level(data, ti, high_level):
+    ti = proper_ti(data, ti)
+    frame = data[ti]
+    if frame["high_level"] == high_level:
+        return data
+    new_frame_d = dict(frame)
+    new_frame_d["high_level"] = high_level
+    return replace_frame(data, ti, new_frame_d)
+
+
+def set_track(data, ti, key, lanes):
+    ti = proper_ti(data, ti)
+    frame = data[ti]
+    new_lanes = dict(frame["lanes"])
+    new_lanes[key] = list(lanes)
+    new_frame_d = dict(frame)
+    new_frame_d["lanes"] = new_lanes
+    return replace_frame(data, ti, new_frame_d)
+
+
+def toggle_lane(data, ti, key, lane):
+    # append the lane to the track, or remove it if it is already tracked
+    track = data[proper_ti(data, ti)]["lanes"][key]
+    tokens = [xx[1] for xx in track]
+    if lane[1] in tokens:
+        i = tokens.index(lane[1])
+        return set_track(data, ti, key, track[:i] + track[i + 1:])
+    return set_track(data, ti, key, track + [lane])
+
+
+def move_lane(data, ti, key, lane_token, mode):
+    track = list(data[proper_ti(data, ti)]["lanes"][key])
+    tokens = [xx[1] for xx in track]
+    if lane_token not in tokens:
+        return data
+    i = tokens.index(lane_token)
+    if mode == "Del":
+        del track[i]
+    elif mode == "Up":
+        if i == 0:
+            return data
+        track[i], track[i-1] = track[i-1], track[i]
+    elif mode == "Down":
+        if i == len(track) - 1:
+            return data
+        track[i], track[i+1] = track[i+1], track[i]
+    else:
+        raise NotImplementedError
+    return set_track(data, ti, key, track)
+
+
+def clear_lanes(data, ti, keys=LANE_KEYS):
+    ti = proper_ti(data, ti)
+    frame = data[ti]
+    new_lanes = dict(frame["lanes"])
+    for key in keys:
+        new_lanes[key] = []
+    new_frame_d = dict(frame)
+    new_frame_d["lanes"] = new_lanes
+    return replace_frame(data, ti, new_frame_d)
+
+
+def add_keyframe(data, ti):
+    if ti in data:
+        return data
+    return replace_frame(data, ti, new_frame())
+
+
+def del_keyframe(data, ti):
+    if ti not in data or ti == 0:
+        return data
+    new_data = dict(data)
+    del new_data[ti]
+    return new_data
+
+
+def apply_track_to_keyframes(data, tis, key, lanes, high_level=None):
+    # bulk edit: make every ti a keyframe and set its track (and optionally its
+    # high-level label) in a single new version; all keyframes share one list
+    new_data = dict(data)
+    track = list(lanes)
+    for ti in tis:
+        frame = new_data.get(ti)
+        new_frame_d = dict(frame) if frame is not None else new_frame()
+        new_lanes = dict(new_frame_d["lanes"])
+        new_lanes[key] = track
+        new_frame_d["lanes"] = new_lanes
+        if high_level is not None:
+            new_frame_d["high_level"] = high_level
+        new_data[ti] = new_frame_d
+    return new_data
+
+
+class History:
+    def __init__(self, data, max_steps=None):
+        self.max_steps = max_steps
+        self.undo_stack = []
+        self.redo_stack = []
+        self.current = data
+
+    def push(self, data, label=""):
+        # no-op edits return the same object and are not recorded
+        if data is self.current:
+            return False
+        self.undo_stack.append((self.current, label))
+        if self.max_steps is not None and len(self.undo_stack) > self.max_steps:
+            del self.undo_stack[0]
+        self.redo_stack = []
+        self.current = data
+        return True
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    def undo(self):
+        # returns the label of the undone edit, None if nothing to undo
+        if not self.undo_stack:
+            return None
+        data, label = self.undo_stack.pop()
+        self.redo_stack.append((self.current, label))
+        self.current = data
+        return label
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        data, label = self.redo_stack.pop()
+        self.undo_stack.append((self.current, label))
+        self.current = data
+        return label
@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import json
+import pickle
+import argparse
+import multiprocessing
+from collections import Counter
+import numpy as np
+
+from anno_history import LANE_KEYS, HIGH_LEVEL_OPTIONS
+
+# Headless QA over all saved annotations. Each annotation file is checked in a
+# worker process: structure (keyframes, empty tracks, high-level labels) and lane
+# continuity (vectorized endpoint gaps, plus lane-graph connectivity when the maps
+# are available). Prints a summary and writes a per-scene issue list as json.
+# Maps are loaded once in the parent; workers only get their lane connectivity
+# (token -> outgoing lane tokens), which is all the checks need.
+
+
+# per-worker state, filled by init_worker: location -> {lane token: outgoing lane tokens}
+_worker_outgoing_d = {}
+
+
+def init_worker(outgoing_d):
+    global _worker_outgoing_d
+    _worker_outgoing_d = outgoing_d if outgoing_d is not None else {}
+
+
+def load_outgoing(data_dir, locations):
+    # lane graph of each location, read once from the map
+    from nuscenes.map_expansion.map_api import NuScenesMap
+    outgoing_d = {}
+    for location in sorted(locations):
+        nusc_map = NuScenesMap(os.path.join(data_dir, 'nuscenes'), map_name=location)
+        outgoing_d[location] = {token: list(conn["outgoing"]) for token, conn in nusc_map.connectivity.items()}
+    return outgoing_d
+
+
+def load_scene_meta(data_dir, use_mini):
+    # first_sample_token -> (location, number of samples)
+    from nuscenes.nuscenes import NuScenes
+    if use_mini:
+        nusc = NuScenes(version='v1.0-mini', dataroot=os.path.join(data_dir, 'nuscenes_mini'), verbose=False)
+    else:
+        nusc = NuScenes(version='v1.0-trainval', dataroot=os.path.join(data_dir, 'nuscenes'), verbose=False)
+    scene_meta = {}
+    for scene in nusc.scene:
+        location = nusc.get("log", scene["log_token"])["location"]
+        scene_meta[scene["first_sample_token"]] = (location, scene["nbr_samples"])
+    return scene_meta
+
+
+def lane_gaps(lanes):
+    # distance between the end of each lane and the start of the next one
+    if len(lanes) < 2:
+        return np.zeros((0,))
+    ends = np.stack([np.asarray(lane[-1])[-1, :2] for lane in lanes[:-1]])
+    starts = np.stack([np.asarray(lane[-1])[0, :2] for lane in lanes[1:]])
+    return np.linalg.norm(ends - starts, axis=1)
+
+
+def check_annotation(data, n_samples=None, outgoing=None, gap_thres=1.0):
+    # outgoing: lane token -> outgoing lane tokens of the scene's map, None to skip graph checks
+    issues = []
+    if not isinstance(data, dict) or len(data) == 0:
+        return [("bad_format", None, None, "annotation is not a non-empty dict")]
+    if 0 not in data:
+        issues.append(("missing_keyframe0", None, None, "no keyframe at timestep 0"))
+    for ti, frame in data.items():
+        if not isinstance(ti, int) or ti < 0 or (n_samples is not None and ti >= n_samples):
+            issues.append(("keyframe_out_of_range", ti, None, "keyframe %s outside [0, %s)" % (ti, n_samples)))
+        if not isinstance(frame, dict) or "lanes" not in frame or "high_level" not in frame:
+            issues.append(("bad_format", ti, None, "keyframe missing 'lanes' or 'high_level'"))
+            continue
+        if frame["high_level"] is None:
+            issues.append(("high_level_none", ti, None, "high_level left as None"))
+        elif frame["high_level"] not in HIGH_LEVEL_OPTIONS:
+            issues.append(("high_level_unknown", ti, None, "unknown high_level %s" % frame["high_level"]))
+        for key in LANE_KEYS:
+            lanes = frame["lanes"].get(key, [])
+            if key == "curr" and len(lanes) == 0:
+                issues.append(("empty_curr", ti, key, "curr track is empty"))
+            tokens = [lane[1] for lane in lanes]
+            if len(set(tokens)) != len(tokens):
+                issues.append(("duplicate_lane", ti, key, "a lane appears twice in the track"))
+            if len(lanes) < 2:
+                continue
+            gaps = lane_gaps(lanes)
+            for i in np.nonzero(gaps > gap_thres)[0]:
+                # geometric gap; confirm with the lane graph when the map is available
+                if outgoing is not None and tokens[i + 1] in outgoing.get(tokens[i], []):
+                    continue
+                issues.append(("disconnected", ti, key, "%s -> %s gap %.2fm" % (tokens[i], tokens[i + 1], gaps[i])))
+            if outgoing is not None:
+                for i in np.nonzero(gaps <= gap_thres)[0]:
+                    if tokens[i + 1] not in outgoing.get(tokens[i], []):
+                        issues.append(("not_in_lane_graph", ti, key, "%s -> %s" % (tokens[i], tokens[i + 1])))
+    return issues
+
+
+def check_file(job):
+    path, source, meta, gap_thres = job
+    token = os.path.basename(path)[:-len(".pickle")]
+    location, n_samples = meta if meta is not None else (None, None)
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except Exception as e:
+        return {"token": token, "source": source, "location": location, "n_keyframes": 0,
+                "issues": [("unreadable", None, None, repr(e))]}
+    try:
+        issues = check_annotation(data, n_samples, _worker_outgoing_d.get(location), gap_thres)
+    except Exception as e:
+        # a malformed file must not take down the whole run
+        issues = [("bad_format", None, None, repr(e))]
+    n_keyframes = len(data) if isinstance(data, dict) else 0
+    return {"token": token, "source": source, "location": location, "n_keyframes": n_keyframes, "issues": issues}
+
+
+def list_jobs(dir_list, scene_meta, gap_thres):
+    jobs = []
+    for source, the_dir in dir_list:
+        if not os.path.isdir(the_dir):
+            continue
+        for fname in sorted(os.listdir(the_dir)):
+            if fname.endswith(".pickle"):
+                meta = scene_meta.get(fname[:-len(".pickle")]) if scene_meta is not None else None
+                jobs.append((os.path.join(the_dir, fname), source, meta, gap_thres))
+    return jobs
+
+
+def run_qa(dir_list, scene_meta=None, data_dir=None, num_workers=None, gap_thres=1.0):
+    jobs = list_jobs(dir_list, scene_meta, gap_thres)
+    outgoing_d = None
+    if data_dir is not None:
+        outgoing_d = load_outgoing(data_dir, set(job[2][0] for job in jobs if job[2] is not None))
+    with multiprocessing.Pool(num_workers, initializer=init_worker, initargs=(outgoing_d,)) as pool:
+        results = pool.map(check_file, jobs, chunksize=max(1, len(jobs) // (4 * (num_workers or os.cpu_count() or 1))))
+
+    issue_counter = Counter()
+    for res in results:
+        issue_counter.update(set(issue[0] for issue in res["issues"]))
+    summary = {
+        "n_files": len(results),
+        "n_clean": len([res for res in results if len(res["issues"]) == 0]),
+        "scenes_with_issue": dict(issue_counter),
+    }
+    if scene_meta is not None:
+        coverage = {}
+        annotated = set(res["token"] for res in results if res["source"] == "save")
+        for token, (location, _) in scene_meta.items():
+            cov = coverage.setdefault(location, {"n_scenes": 0, "n_annotated": 0})
+            cov["n_scenes"] += 1
+            cov["n_annotated"] += int(token in annotated)
+        summary["coverage"] = coverage
+        summary["unknown_tokens"] = [res["token"] for res in results if res["location"] is None]
+    return summary, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("NuScenes annotation QA")
+    parser.add_argument("--nuscenes_data_dir", type=str, default="../../dataset")
+    parser.add_argument("--nuscenes_preview_dir", type=str, default="./preview_data")
+    parser.add_argument("--nuscenes_save_dir", type=str, default="./saved_data")
+    parser.add_argument("--use_mini", action='store_true', default=False)
+    parser.add_argument("--no_map", action='store_true', default=False, help="skip dataset/map loading, structural checks only")
+    parser.add_argument("--num_workers", type=int, default=None)
+    parser.add_argument("--gap_thres", type=float, default=1.0, help="max gap (m) between consecutive lanes")
+    parser.add_argument("--report", type=str, default="./qa_report.json")
+    args = parser.parse_args()
+
+    tt1 = time.time()
+    scene_meta = None
+    data_dir = None
+    if not args.no_map:
+        scene_meta = load_scene_meta(args.nuscenes_data_dir, args.use_mini)
+        data_dir = args.nuscenes_data_dir
+    dir_list = [("save", args.nuscenes_save_dir), ("preview", args.nuscenes_preview_dir)]
+    summary, results = run_qa(dir_list, scene_meta, data_dir, args.num_workers, args.gap_thres)
+
+    print("Checked %d files (%d clean) in %.3f seconds" % (summary["n_files"], summary["n_clean"], time.time() - tt1))
+    for issue_type, cnt in sorted(summary["scenes_with_issue"].items()):
+        print("  %-22s %d scenes" % (issue_type, cnt))
+    for location, cov in sorted(summary.get("coverage", {}).items()):
+        print("  %-26s %d/%d scenes annotated" % (location, cov["n_annotated"], cov["n_scenes"]))
+
+    per_scene = [
+        {"token": res["token"], "source": res["source"], "location": res["location"], "n_keyframes": res["n_keyframes"],
+         "issues": [{"type": it, "ti": ti, "key": key, "msg": msg} for it, ti, key, msg in res["issues"]]}
+        for res in results if len(res["issues"]) > 0]
+    with open(args.report, "w") as f:
+        json.dump({"summary": summary, "scenes": per_scene}, f, indent=2)
+    print("Report saved to", args.report)
+    sys.exit(0 if summary["n_clean"] == summary["n_files"] else 1)
@@ -0,0 +1,256 @@
+import os
+import numpy as np
+
+import anno_history
+from anno_history import History, LANE_KEYS, LOCATION_LIST
+from lane_geom import LaneGeomCache, get_lanes_nearby, build_lane_index
+from anno_store import write_pickle_atomic
+from ego_sweeps import load_ego_sweeps, resample_ego_sweeps
+
+# Headless annotation engine: owns the dataset, the current scene and timestep,
+# the per-scene annotation histories and the lane queries. MyGUIApp is a view on
+# top of it; scripts and benchmarks can drive it directly without Qt.
+
+
+
+def scene_patch(ego_traj, r=100, margin=20):
+    # same patch visualize_nuscenes_scene renders for the trajectory (plus the axis margin)
+    tj_xmin, tj_ymin = np.min(ego_traj[:, 0]), np.min(ego_traj[:, 1])
+    tj_xmax, tj_ymax = np.max(ego_traj[:, 0]), np.max(ego_traj[:, 1])
+    radius = r + max(tj_xmax - tj_xmin, tj_ymax - tj_ymin) / 2 + margin
+    cx, cy = (tj_xmin + tj_xmax) / 2, (tj_ymin + tj_ymax) / 2
+    return (cx - radius, cy - radius, cx + radius, cy + radius)
+
+
+class AnnotationSession:
+    def __init__(self, store=None, lane_cache=None, ego_rate=0, cache_dir=None):
+        self.store = store
+        self.lane_cache = lane_cache if lane_cache is not None else LaneGeomCache()
+        # ego timeline: 0 = keyframes only (2 Hz), <0 = every LIDAR_TOP sweep, >0 = sweeps resampled to ego_rate Hz
+        self.ego_rate = ego_rate
+        self.cache_dir = cache_dir
+        self.dense_trajs = {}  # token -> (traj, step_ti)
+        self.nusc = None
+        self.nusc_map_d = {}
+        self.histories = {}  # token -> History, kept across scene switches until saved or dropped
+        self.lane_indices = {}  # token -> LaneIndex
+
+        self.scene_id = None
+        self.token = None
+        self.location = None
+        self.nusc_map = None
+        self.ego_traj = None
+        self.step_ti = np.zeros(0, dtype=np.int64)  # timeline step -> keyframe index
+        self.sample_tokens = []
+        self.cur_ti = 0
+        self.cur_step = 0
+        self.history = History(anno_history.new_annotation())
+        self.lease_owner = None
+
+    # ---------- dataset ----------
+    def load_dataset(self, data_dir, use_mini):
+        from nuscenes.nuscenes import NuScenes
+        from nuscenes.map_expansion.map_api import NuScenesMap
+        if use_mini:
+            self.nusc = NuScenes(version='v1.0-mini', dataroot=os.path.join(data_dir, 'nuscenes_mini'), verbose=True)
+        else:
+            self.nusc = NuScenes(version='v1.0-trainval', dataroot=os.path.join(data_dir, 'nuscenes'), verbose=True)
+        for map_name in LOCATION_LIST:
+            self.nusc_map_d[map_name] = NuScenesMap(os.path.join(data_dir, 'nuscenes'), map_name=map_name)
+
+    def scene_rows(self):
+        # [first sample token, log token, location] per scene, in dataset order
+        rows = []
+        for scene in self.nusc.scene:
+            log = self.nusc.get("log", scene["log_token"])
+            rows.append([str(scene["first_sample_token"]), str(scene["log_token"]), str(log["location"])])
+        return rows
+
+    def scene_location(self, scene_id):
+        return self.nusc.get("log", self.nusc.scene[scene_id]["log_token"])["location"]
+
+    # ---------- scene ----------
+    def open_scene(self, scene_id):
+        my_scene = self.nusc.scene[scene_id]
+        self.scene_id = scene_id
+        self.location = self.scene_location(scene_id)
+        self.nusc_map = self.nusc_map_d[self.location]
+        the_token = my_scene["first_sample_token"]
+        ego_traj = []
+        sample_tokens = []
+        while the_token != "":
+            the_sample = self.nusc.get("sample", the_token)
+            the_lidar_data = self.nusc.get("sample_data", the_sample['data']["LIDAR_TOP"])
+            ego_traj.append(self.nusc.get("ego_pose", the_lidar_data["ego_pose_token"])["translation"])
+            sample_tokens.append(the_token)
+            the_token = the_sample["next"]
+        self.sample_tokens = sample_tokens
+        self.ego_traj, self.step_ti = self.get_timeline(my_scene["first_sample_token"], np.array(ego_traj))
+        return self.open_annotation(my_scene["first_sample_token"])
+
+    def get_timeline(self, token, key_traj):
+        if self.ego_rate == 0:
+            return key_traj, np.arange(key_traj.shape[0])
+        if token not in self.dense_trajs:
+            sweeps = load_ego_sweeps(self.nusc, token, self.cache_dir)
+            traj, step_ti, _ = resample_ego_sweeps(sweeps, self.ego_rate)
+            self.dense_trajs[token] = (traj, step_ti)
+        return self.dense_trajs[token]
+
+    def open_annotation(self, token, data=None):
+        # switch to a scene's annotation: in-memory history first, then the store, then new.
+        # Returns the owner of the scene lease if someone else holds it, else None.
+        self.token = token
+        self.cur_ti = 0
+        self.cur_step = 0
+        if token not in self.histories:
+            if data is None and self.store is not None:
+                data = self.store.load(token)
+            if data is None:
+                data = anno_history.new_annotation()
+            self.histories[token] = History(data)
+        self.history = self.histories[token]
+        self.lease_owner = None
+        if self.store is not None:
+            for held in list(self.store.held):
+                if held != token:
+                    self.store.release(held)
+            self.lease_owner = self.store.acquire(token)
+        return self.lease_owner
+
+    def retry_lease(self):
+        # for a read-only scene: take the lease if it is free now, and reload what the
+        # other annotator published meanwhile (nothing was edited here while read-only)
+        if self.lease_owner is not None and self.store is not None:
+            self.lease_owner = self.store.acquire(self.token)
+            if self.lease_owner is None:
+                data = self.store.load(self.token)
+                if data is not None:
+                    self.histories[self.token] = History(data)
+                    self.history = self.histories[self.token]
+        return self.lease_owner
+
+    def drop_scene(self, token):
+        # forget in-memory edits, e.g. after another annotator published the scene
+        if token != self.token:
+            self.histories.pop(token, None)
+
+    def get_annotation(self, token):
+        if token in self.histories:
+            return self.histories[token].current
+        if self.store is not None:
+            return self.store.load(token)
+        return None
+
+    @property
+    def data(self):
+        return self.history.current
+
+    def num_steps(self):
+        return len(self.step_ti)
+
+    def set_step(self, step):
+        # position on the (possibly dense) ego timeline; edits go to the keyframe governing it
+        self.cur_step = step
+        self.cur_ti = int(self.step_ti[step])
+
+    def set_timestep(self, ti):
+        # jump to keyframe sample ti
+        self.cur_ti = ti
+        self.cur_step = int(np.searchsorted(self.step_ti, ti))
+
+    def ego_state(self):
+        return self.ego_traj[self.cur_step]
+
+    def frame(self, ti=None, data=None):
+        data = self.data if data is None else data
+        ti = self.cur_ti if ti is None else ti
+        tj = anno_history.proper_ti(data, ti)
+        return data[tj] if tj is not None else None
+
+    def is_keyframe(self, ti=None):
+        return (self.cur_ti if ti is None else ti) in self.data
+
+    # ---------- queries ----------
+    def query_lanes(self, x, y, radius=6):
+        return get_lanes_nearby(self.nusc_map, x, y, radius, lane_cache=self.lane_cache)
+
+    def get_lane_index(self, patch=None):
+        if self.token not in self.lane_indices:
+            patch = scene_patch(self.ego_traj) if patch is None else patch
+            self.lane_indices[self.token] = build_lane_index(self.nusc_map, self.lane_cache, patch)
+        return self.lane_indices[self.token]
+
+    def pick_lane(self, x, y, candidates=None, use_index=False, max_dist=4):
+        # nearest lane within max_dist. With use_index the scene lane index decides (it is
+        # what hover highlights) and the candidates (query results) are only a fallback.
+        # Returns (lane, candidate index or None).
+        if use_index and self.nusc_map is not None:
+            lane = self.get_lane_index().query(x, y, max_dist=max_dist)
+            if lane is not None:
+                tokens = [xx[1] for xx in candidates] if candidates is not None else []
+                return lane, tokens.index(lane[1]) if lane[1] in tokens else None
+        if candidates is not None and len(candidates) > 0:
+            pt = np.array([[x, y]])
+            d_min, lane_min, id_min = max_dist, None, None
+            for lane_i, lane in enumerate(candidates):
+                d = np.min(np.linalg.norm(lane[-1][:, :2] - pt, axis=1))
+                if d < d_min:
+                    d_min, lane_min, id_min = d, lane, lane_i
+            return lane_min, id_min
+        return None, None
+
+    # ---------- edits ----------
+    def edit(self, new_data, label):
+        # every edit goes through the history so it can be undone;
+        # read-only while another annotator holds the scene lease
+        if self.lease_owner is not None:
+            return False
+        return self.history.push(new_data, label)
+
+    def toggle_lane(self, key, lane):
+        return self.edit(anno_history.toggle_lane(self.data, self.cur_ti, key, lane), "toggle %s lane" % key)
+
+    def move_lane(self, key, lane_token, mode):
+        return self.edit(anno_history.move_lane(self.data, self.cur_ti, key, lane_token, mode), "%s %s lane" % (mode, key))
+
+    def clear(self, keys=LANE_KEYS):
+        return self.edit(anno_history.clear_lanes(self.data, self.cur_ti, keys), "clear" if len(keys) == 1 else "clear all")
+
+    def set_high_level(self, high_level):
+        return self.edit(anno_history.set_high_level(self.data, self.cur_ti, high_level), "high level")
+
+    def add_keyframe(self):
+        return self.edit(anno_history.add_keyframe(self.data, self.cur_ti), "add frame")
+
+    def del_keyframe(self):
+        return self.edit(anno_history.del_keyframe(self.data, self.cur_ti), "del frame")
+
+    def apply_lane_sequence(self, key, lanes, tis, high_level=None):
+        # bulk edit as one undo step: lanes may be (dist, token, points) tuples or lane tokens
+        lanes = [lane if isinstance(lane, tuple) else self.lane_tuple(lane) for lane in lanes]
+        return self.edit(anno_history.apply_track_to_keyframes(self.data, tis, key, lanes, high_level), "apply %s sequence" % key)
+
+    def lane_tuple(self, token):
+        points = self.lane_cache.get_dense(self.nusc_map, [token])[token]
+        return (0.0, token, points)
+
+    def undo(self):
+        return self.history.undo()
+
+    def redo(self):
+        return self.history.redo()
+
+    # ---------- persistence ----------
+    def save(self, path=None):
+        # returns None when published, otherwise the owner holding the scene.
+        # Without a store (scripts) the annotation is written to path instead
+        if path is not None or self.store is None:
+            if path is None:
+                raise ValueError("AnnotationSession has no store, pass a path to save()")
+            write_pickle_atomic(path, self.data)
+            return None
+        owner = self.store.publish(self.token, self.data)
+        if owner is None:
+            self.lease_owner = None
+        return owner
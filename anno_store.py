@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import uuid
+import pickle
+import socket
+import getpass
+import argparse
+import random
+import multiprocessing
+
+# Annotation store shared by several annotators on the same save dir.
+#   <save_dir>/<token>.pickle          published annotation (same format as before)
+#   <save_dir>/.leases/<token>.lease   who is currently editing the scene
+#   <save_dir>/.changes                append-only change feed (one json per line)
+# Publishing writes a temp file and os.replace()s it, so readers never see
+# half-written pickles. Clients follow the change feed from a byte offset
+# instead of rescanning the directory. Lease renewals only rewrite the lease
+# file, so the feed grows with acquires, releases and publishes, not with time.
+
+LEASE_DIR = ".leases"
+FEED_NAME = ".changes"
+
+
+def write_pickle_atomic(path, data):
+    # readers see either the old file or the complete new one
+    tmp_path = "%s.%s.tmp" % (path, uuid.uuid4().hex[:8])
+    with open(tmp_path, "wb") as f:
+        pickle.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def make_owner_id():
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "unknown"
+    return "%s@%s:%d:%s" % (user, socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+
+
+class AnnoStore:
+    def __init__(self, save_dir, owner=None, lease_ttl=60.0):
+        self.save_dir = save_dir
+        self.lease_dir = os.path.join(save_dir, LEASE_DIR)
+        self.feed_path = os.path.join(save_dir, FEED_NAME)
+        self.owner = owner if owner is not None else make_owner_id()
+        self.lease_ttl = lease_ttl
+        os.makedirs(self.lease_dir, exist_ok=True)
+
+        # client-side view of the store, kept fresh by poll()
+        self.done = set()
+        self.leases = {}  # token -> {"owner":..., "expires":...}
+        self.held = set()  # tokens leased by this client
+        self.feed_offset = 0
+        self.feed_rest = b""
+
+    # ---------- paths ----------
+    def anno_path(self, token):
+        return os.path.join(self.save_dir, "%s.pickle" % token)
+
+    def lease_path(self, token):
+        return os.path.join(self.lease_dir, "%s.lease" % token)
+
+    # ---------- change feed ----------
+    def append_event(self, event, token, **kwargs):
+        rec = {"t": time.time(), "event": event, "token": token, "owner": self.owner}
+        rec.update(kwargs)
+        line = (json.dumps(rec) + "\n").encode("utf-8")
+        # a single O_APPEND write keeps lines from different writers intact
+        fd = os.open(self.feed_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def apply_event(self, rec):
+        token = rec["token"]
+        if rec["event"] == "publish":
+            self.done.add(token)
+        elif rec["event"] == "lease":
+            self.leases[token] = {"owner": rec["owner"], "expires": rec["expires"]}
+        elif rec["event"] == "release":
+            info = self.leases.get(token)
+            if info is not None and info["owner"] == rec["owner"]:
+                del self.leases[token]
+
+    def poll(self):
+        # returns the list of new events since the last poll
+        try:
+            size = os.stat(self.feed_path).st_size
+        except FileNotFoundError:
+            return []
+        if size <= self.feed_offset:
+            return []
+        with open(self.feed_path, "rb") as f:
+            f.seek(self.feed_offset)
+            chunk = f.read(size - self.feed_offset)
+        self.feed_offset += len(chunk)
+        lines = (self.feed_rest + chunk).split(b"\n")
+        self.feed_rest = lines.pop()  # incomplete trailing line, if any
+        events = []
+        for line in lines:
+            if not line:
+                continue
+            try:
+                rec = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            self.apply_event(rec)
+            events.append(rec)
+        return events
+
+    def scan(self):
+        # one-time directory scan for the current state; the feed is only followed
+        # from here on, events before the scan are already reflected in the files
+        try:
+            self.feed_offset = os.stat(self.feed_path).st_size
+        except FileNotFoundError:
+            self.feed_offset = 0
+        self.feed_rest = b""
+        for fname in os.listdir(self.save_dir):
+            if fname.endswith(".pickle"):
+                self.done.add(fname[:-len(".pickle")])
+        for fname in os.listdir(self.lease_dir):
+            if fname.endswith(".lease"):
+                token = fname[:-len(".lease")]
+                info = self.read_lease(token)
+                if info is not None:
+                    self.leases[token] = info
+        self.poll()
+
+    # ---------- status ----------
+    def is_done(self, token):
+        return token in self.done
+
+    def lease_owner(self, token):
+        info = self.leases.get(token)
+        if info is not None and info["expires"] < time.time() and token not in self.held:
+            # renewals are not in the feed, the lease file has the current expiry
+            info = self.read_lease(token)
+            if info is None or info["expires"] < time.time():
+                del self.leases[token]
+                return None
+            self.leases[token] = info
+        if info is None or info["expires"] < time.time():
+            return None
+        return info["owner"]
+
+    def status(self, token):
+        if self.lease_owner(token) is not None:
+            return "in-progress"
+        if self.is_done(token):
+            return "done"
+        return None
+
+    # ---------- leases ----------
+    def read_lease(self, token):
+        try:
+            with open(self.lease_path(token), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_lease_file(self, token, info):
+        tmp_path = "%s.%s.tmp" % (self.lease_path(token), uuid.uuid4().hex[:8])
+        with open(tmp_path, "w") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self.lease_path(token))
+
+    def break_stale_lease(self, token):
+        # only one client at a time may break a lease, and it re-checks inside
+        # the guard so a lease that was just re-created is never removed
+        guard = self.lease_path(token) + ".break"
+        try:
+            os.mkdir(guard)
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(guard).st_mtime > self.lease_ttl:
+                    os.rmdir(guard)
+            except OSError:
+                pass
+            return
+        try:
+            info = self.read_lease(token)
+            if info is not None and info["expires"] < time.time():
+                try:
+                    os.unlink(self.lease_path(token))
+                except FileNotFoundError:
+                    pass
+        finally:
+            os.rmdir(guard)
+
+    def acquire(self, token):
+        # returns None on success, otherwise the owner currently holding the scene
+        info = {"owner": self.owner, "expires": time.time() + self.lease_ttl}
+        for _ in range(2):
+            try:
+                fd = os.open(self.lease_path(token), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                other = self.read_lease(token)
+                if other is not None and other["owner"] == self.owner:
+                    self.held.add(token)
+                    return self.renew(token)
+                if other is not None and other["expires"] >= time.time():
+                    return other["owner"]
+                self.break_stale_lease(token)
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump(info, f)
+            self.held.add(token)
+            self.leases[token] = info
+            self.append_event("lease", token, expires=info["expires"])
+            return None
+        other = self.read_lease(token)
+        return other["owner"] if other is not None else "unknown"
+
+    def renew(self, token):
+        info = self.read_lease(token)
+        if info is None or info["owner"] != self.owner:
+            self.held.discard(token)
+            return info["owner"] if info is not None else "unknown"
+        expired = info["expires"] < time.time()
+        info["expires"] = time.time() + self.lease_ttl
+        self.write_lease_file(token, info)
+        self.leases[token] = info
+        if expired:
+            # others may have dropped the lapsed lease, announce it again
+            self.append_event("lease", token, expires=info["expires"])
+        return None
+
+    def renew_all(self):
+        for token in list(self.held):
+            self.renew(token)
+
+    def release(self, token):
+        self.held.discard(token)
+        info = self.read_lease(token)
+        if info is not None and info["owner"] == self.owner:
+            # log before unlinking so the feed never shows two holders at once
+            self.append_event("release", token)
+            try:
+                os.unlink(self.lease_path(token))
+            except FileNotFoundError:
+                pass
+        if token in self.leases and self.leases[token]["owner"] == self.owner:
+            del self.leases[token]
+
+    def release_all(self):
+        for token in list(self.held):
+            self.release(token)
+
+    # ---------- data ----------
+    def load(self, token):
+        path = self.anno_path(token)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def publish(self, token, data):
+        # returns None on success, otherwise the owner holding the lease
+        if token not in self.held:
+            owner = self.acquire(token)
+            if owner is not None:
+                return owner
+        else:
+            owner = self.renew(token)
+            if owner is not None:
+                return owner
+        write_pickle_atomic(self.anno_path(token), data)
+        self.done.add(token)
+        self.append_event("publish", token)
+        return None
+
+
+# ---------- local-filesystem stress harness ----------
+def stress_writer(save_dir, writer_i, tokens, n_ops, lease_ttl, seed):
+    rng = random.Random(seed)
+    store = AnnoStore(save_dir, owner="writer%03d" % writer_i, lease_ttl=lease_ttl)
+    n_published = 0
+    for _ in range(n_ops):
+        token = rng.choice(tokens)
+        if store.acquire(token) is not None:
+            continue
+        # hold the scene briefly, record who we are in the data
+        data = store.load(token) or {"writers": []}
+        data["writers"].append(store.owner)
+        time.sleep(rng.random() * 0.005)
+        if store.publish(token, data) is None:
+            n_published += 1
+        store.release(token)
+    return n_published
+
+
+def run_stress(save_dir, n_writers=32, n_scenes=8, n_ops=40, lease_ttl=30.0):
+    os.makedirs(save_dir, exist_ok=True)
+    tokens = ["scene%03d" % i for i in range(n_scenes)]
+    jobs = [(save_dir, i, tokens, n_ops, lease_ttl, i) for i in range(n_writers)]
+    tt1 = time.time()
+    with multiprocessing.Pool(n_writers) as pool:
+        n_published = sum(pool.starmap(stress_writer, jobs))
+    print("%d writers published %d times in %.3f seconds" % (n_writers, n_published, time.time() - tt1))
+
+    # every publish must have been made under an exclusive lease: since each
+    # writer appends to the data it loaded, a lost update shows up as a count mismatch
+    reader = AnnoStore(save_dir, owner="reader")
+    events = reader.poll()
+    n_writes = 0
+    for token in tokens:
+        data = reader.load(token)
+        n_writes += len(data["writers"]) if data is not None else 0
+    n_feed_publish = len([rec for rec in events if rec["event"] == "publish"])
+    assert n_writes == n_published == n_feed_publish, (n_writes, n_published, n_feed_publish)
+
+    # lease intervals of different owners never overlap on the same scene
+    holder = {}
+    for rec in events:
+        if rec["event"] == "lease":
+            assert holder.get(rec["token"]) in [None, rec["owner"]], rec
+            holder[rec["token"]] = rec["owner"]
+        elif rec["event"] == "release":
+            holder.pop(rec["token"], None)
+        elif rec["event"] == "publish":
+            assert holder.get(rec["token"]) == rec["owner"], rec
+    assert all(reader.lease_owner(token) is None for token in tokens)
+    print("OK: %d publishes, %d feed events, no lost updates" % (n_writes, len(events)))
+
+
+if __name__ == "__main__":
+    import tempfile
+    parser = argparse.ArgumentParser("Annotation store stress test")
+    parser.add_argument("--save_dir", type=str, default=None)
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=40)
+    args = parser.parse_args()
+    if args.save_dir is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            run_stress(tmp_dir, args.writers, args.scenes, args.ops)
+    else:
+        run_stress(args.save_dir, args.writers, args.scenes, args.ops)
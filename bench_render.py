@@ -0,0 +1,85 @@
+import os
+import gc
+import sys
+import time
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from nuscenes.nuscenes import NuScenes
+from nuscenes.map_expansion.map_api import NuScenesMap
+
+from utils import render_nuscenes_scene
+
+# Soak benchmark for the render pipeline: renders scenes over and over (as
+# opening them in the GUI does) and checks that resident memory stays flat.
+
+
+def get_rss_mb():
+    # current (not peak) resident set size
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_ego_traj(nusc, scene):
+    ego_traj = []
+    the_token = scene["first_sample_token"]
+    while the_token != "":
+        the_sample = nusc.get("sample", the_token)
+        the_lidar_data = nusc.get("sample_data", the_sample['data']["LIDAR_TOP"])
+        ego_traj.append(nusc.get("ego_pose", the_lidar_data["ego_pose_token"])["translation"])
+        the_token = the_sample["next"]
+    return np.array(ego_traj)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Render pipeline soak benchmark")
+    parser.add_argument("--nuscenes_data_dir", type=str, default="../../dataset")
+    parser.add_argument("--use_mini", action='store_true', default=False)
+    parser.add_argument("--num_renders", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20, help="renders before the memory baseline is taken")
+    parser.add_argument("--max_growth_mb", type=float, default=50.0)
+    args = parser.parse_args()
+
+    if args.use_mini:
+        nusc = NuScenes(version='v1.0-mini', dataroot=os.path.join(args.nuscenes_data_dir, 'nuscenes_mini'), verbose=False)
+    else:
+        nusc = NuScenes(version='v1.0-trainval', dataroot=os.path.join(args.nuscenes_data_dir, 'nuscenes'), verbose=False)
+    nusc_map_d = {}
+    scene_list = []
+    for scene in nusc.scene:
+        location = nusc.get("log", scene["log_token"])["location"]
+        if location not in nusc_map_d:
+            nusc_map_d[location] = NuScenesMap(os.path.join(args.nuscenes_data_dir, 'nuscenes'), map_name=location)
+        scene_list.append((nusc_map_d[location], get_ego_traj(nusc, scene)))
+
+    # QImage works without an application object, but keep Qt happy if it asks for one
+    from PyQt5.QtGui import QGuiApplication
+    app = QGuiApplication.instance() or QGuiApplication(["bench_render", "-platform", "offscreen"])
+
+    rss_list = []
+    tt1 = time.time()
+    for i in range(args.num_renders):
+        nusc_map, ego_traj = scene_list[i % len(scene_list)]
+        qimage, qimage_legend, my_tf = render_nuscenes_scene(nusc_map, ego_traj)
+        del qimage, qimage_legend, my_tf
+        gc.collect()
+        rss_list.append(get_rss_mb())
+        if (i + 1) % 20 == 0:
+            print("%4d renders  %.2fs/render  rss %.1f MB  open figures %d" % (
+                i + 1, (time.time() - tt1) / (i + 1), rss_list[-1], len(plt.get_fignums())))
+
+    assert len(plt.get_fignums()) == 0, "figures left open: %s" % plt.get_fignums()
+    baseline = np.median(rss_list[args.warmup:args.warmup + 20])
+    growth = np.median(rss_list[-20:]) - baseline
+    print("rss baseline %.1f MB, final %.1f MB, growth %.1f MB" % (baseline, np.median(rss_list[-20:]), growth))
+    if growth > args.max_growth_mb:
+        print("FAIL: resident memory grew by %.1f MB (> %.1f MB)" % (growth, args.max_growth_mb))
+        sys.exit(1)
+    print("OK")
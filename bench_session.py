@@ -0,0 +1,65 @@
+import time
+import argparse
+import numpy as np
+
+from anno_session import AnnotationSession
+from anno_history import LANE_KEYS
+
+# Headless benchmark of the annotation engine: bulk edits, per-frame toggles and
+# undo/redo on synthetic lanes, no Qt, no dataset needed.
+
+
+def make_lanes(num_lanes, num_points, seed=0):
+    rng = np.random.default_rng(seed)
+    lanes = []
+    for lane_i in range(num_lanes):
+        steps = rng.normal(size=(num_points, 2)) * 0.2 + np.array([1.0, 0.0])
+        points = np.concatenate([np.cumsum(steps, axis=0), np.zeros((num_points, 1))], axis=1)
+        lanes.append((0.0, "lane-%05d" % lane_i, points))
+    return lanes
+
+
+def timeit(label, func, n):
+    tt1 = time.time()
+    for i in range(n):
+        func(i)
+    dt = time.time() - tt1
+    print("%-28s %6d ops  %.3fs  %.1fus/op" % (label, n, dt, dt / n * 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Annotation session benchmark")
+    parser.add_argument("--num_steps", type=int, default=4000, help="timesteps (all become keyframes)")
+    parser.add_argument("--num_lanes", type=int, default=200)
+    parser.add_argument("--num_points", type=int, default=100)
+    parser.add_argument("--num_edits", type=int, default=5000)
+    args = parser.parse_args()
+
+    lanes = make_lanes(args.num_lanes, args.num_points)
+    session = AnnotationSession()
+    session.open_annotation("bench")
+    tis = list(range(args.num_steps))
+
+    tt1 = time.time()
+    for key_i, key in enumerate(LANE_KEYS):
+        session.apply_lane_sequence(key, lanes[key_i * 10:key_i * 10 + 10], tis, high_level="Lane-keeping")
+    print("apply_lane_sequence x%d over %d keyframes took %.3f seconds" % (len(LANE_KEYS), len(tis), time.time() - tt1))
+    assert len(session.data) == args.num_steps
+
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, args.num_lanes, size=args.num_edits)
+    steps = rng.integers(0, args.num_steps, size=args.num_edits)
+
+    def toggle(i):
+        session.set_timestep(int(steps[i]))
+        session.toggle_lane(LANE_KEYS[i % 3], lanes[picks[i]])
+    timeit("toggle_lane", toggle, args.num_edits)
+    timeit("frame lookup", lambda i: session.frame(int(steps[i])), args.num_edits)
+    timeit("undo", lambda i: session.undo(), args.num_edits)
+    timeit("redo", lambda i: session.redo(), args.num_edits)
+
+    # a bulk edit is one undo step
+    session.apply_lane_sequence("curr", [], tis)
+    assert session.undo() == "apply curr sequence"
+    assert len(session.frame(0)["lanes"]["curr"]) > 0
+    print("OK")
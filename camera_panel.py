@@ -0,0 +1,150 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import Qt, QObject, QSize, pyqtSignal
+from PyQt5.QtGui import QImageReader, QPixmap
+from PyQt5.QtWidgets import QWidget, QLabel, QHBoxLayout, QVBoxLayout
+
+CAMERA_CHANNELS = ["CAM_FRONT_LEFT", "CAM_FRONT", "CAM_FRONT_RIGHT", "CAM_BACK_LEFT", "CAM_BACK", "CAM_BACK_RIGHT"]
+
+
+def get_scene_camera_paths(nusc, first_sample_token, channels=CAMERA_CHANNELS):
+    # cam_paths[ti][channel] -> jpeg path of that camera at timestep ti
+    cam_paths = []
+    the_token = first_sample_token
+    while the_token != "":
+        the_sample = nusc.get("sample", the_token)
+        cam_paths.append({ch: nusc.get_sample_data_path(the_sample["data"][ch]) for ch in channels if ch in the_sample["data"]})
+        the_token = the_sample["next"]
+    return cam_paths
+
+
+class ThumbnailLoader(QObject):
+    # decodes + downscales jpegs on a thread pool into a bounded LRU of QImages.
+    # QImage (unlike QPixmap) is safe to build off the GUI thread; thumbReady is
+    # emitted from the worker and delivered to the GUI thread as a queued signal.
+    thumbReady = pyqtSignal(str)
+
+    def __init__(self, thumb_width=200, max_items=256, num_workers=4):
+        super().__init__()
+        self.thumb_width = thumb_width
+        self.max_items = max_items
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.wanted = set()
+        self.executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="thumb")
+
+    def get(self, path):
+        with self.lock:
+            image = self.lru.get(path)
+            if image is not None:
+                self.lru.move_to_end(path)
+            return image
+
+    def set_wanted(self, paths):
+        # requests that are no longer wanted are dropped before decoding
+        with self.lock:
+            self.wanted = set(paths)
+
+    def request(self, path):
+        with self.lock:
+            if path in self.lru or path in self.pending:
+                return
+            self.pending.add(path)
+        self.executor.submit(self.decode, path)
+
+    def decode(self, path):
+        try:
+            with self.lock:
+                if path not in self.wanted:
+                    return
+            reader = QImageReader(path)
+            size = reader.size()
+            if size.isValid() and size.width() > self.thumb_width:
+                # lets the jpeg decoder downscale while decoding
+                reader.setScaledSize(QSize(self.thumb_width, size.height() * self.thumb_width // size.width()))
+            image = reader.read()
+            if image.isNull():
+                return
+            with self.lock:
+                self.lru[path] = image
+                while len(self.lru) > self.max_items:
+                    self.lru.popitem(last=False)
+            self.thumbReady.emit(path)
+        finally:
+            with self.lock:
+                self.pending.discard(path)
+
+    def shutdown(self):
+        with self.lock:
+            self.wanted = set()
+        self.executor.shutdown(wait=False)
+
+
+class CameraPanel(QWidget):
+    def __init__(self, channels=CAMERA_CHANNELS, thumb_width=150, prefetch_ahead=4, prefetch_behind=2):
+        super().__init__()
+        self.channels = channels
+        self.prefetch_ahead = prefetch_ahead
+        self.prefetch_behind = prefetch_behind
+        self.loader = ThumbnailLoader(thumb_width=thumb_width)
+        self.loader.thumbReady.connect(self.on_thumb_ready)
+        self.cam_paths = []
+        self.cur_ti = None
+
+        self.layout = QHBoxLayout()
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(self.layout)
+        self.labels = {}
+        for ch in channels:
+            ch_layout = QVBoxLayout()
+            label = QLabel()
+            label.setFixedSize(thumb_width, thumb_width * 9 // 16)
+            label.setAlignment(Qt.AlignCenter)
+            label.setStyleSheet("background-color: rgb(30, 30, 30); color: gray")
+            ch_layout.addWidget(QLabel(ch))
+            ch_layout.addWidget(label)
+            self.layout.addLayout(ch_layout)
+            self.labels[ch] = label
+
+    def set_scene(self, cam_paths):
+        self.cam_paths = cam_paths
+        self.cur_ti = None
+
+    def show_timestep(self, ti):
+        self.cur_ti = ti
+        if ti is None or ti >= len(self.cam_paths):
+            return
+        # current frame first, then the nearest neighbors, ahead before behind
+        order = [ti]
+        for k in range(1, max(self.prefetch_ahead, self.prefetch_behind) + 1):
+            if k <= self.prefetch_ahead and ti + k < len(self.cam_paths):
+                order.append(ti + k)
+            if k <= self.prefetch_behind and ti - k >= 0:
+                order.append(ti - k)
+        paths = [self.cam_paths[tj][ch] for tj in order for ch in self.channels if ch in self.cam_paths[tj]]
+        self.loader.set_wanted(paths)
+        for path in paths:
+            self.loader.request(path)
+        for ch in self.channels:
+            self.update_label(ch)
+
+    def update_label(self, ch):
+        label = self.labels[ch]
+        path = self.cam_paths[self.cur_ti].get(ch)
+        image = self.loader.get(path) if path is not None else None
+        if image is None:
+            label.setText("loading..." if path is not None else "n/a")
+        else:
+            label.setPixmap(QPixmap.fromImage(image).scaled(label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def on_thumb_ready(self, path):
+        if self.cur_ti is None or self.cur_ti >= len(self.cam_paths):
+            return
+        for ch, ch_path in self.cam_paths[self.cur_ti].items():
+            if ch_path == path and ch in self.labels:
+                self.update_label(ch)
+
+    def shutdown(self):
+        self.loader.shutdown()
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+
+from npz_cache import load_npz_cached
+
+# High-rate ego trajectory. Samples (keyframes) come at 2 Hz, but every LIDAR_TOP
+# sweep (~20 Hz) has its own ego pose. The sweeps of a scene are collected in one
+# pass along the sample_data chain and cached per scene; the dense timeline can then
+# be resampled to any rate. Every dense step keeps the index of the keyframe sample
+# at or before it, so annotations (keyed by keyframe) map onto it unchanged.
+
+
+def collect_ego_sweeps(nusc, first_sample_token):
+    # timestamp [us], ego translation and governing keyframe index of every sweep
+    first_sample = nusc.get("sample", first_sample_token)
+    num_samples = nusc.get("scene", first_sample["scene_token"])["nbr_samples"]
+    timestamps, translations, key_ti, is_key = [], [], [], []
+    ti = -1
+    sd_token = first_sample["data"]["LIDAR_TOP"]
+    while sd_token != "":
+        sd = nusc.get("sample_data", sd_token)
+        if sd["is_key_frame"]:
+            ti += 1
+            if ti >= num_samples:
+                break
+        timestamps.append(sd["timestamp"])
+        translations.append(nusc.get("ego_pose", sd["ego_pose_token"])["translation"])
+        key_ti.append(ti)
+        is_key.append(sd["is_key_frame"])
+        sd_token = sd["next"]
+    return {
+        "timestamp": np.array(timestamps, dtype=np.int64),
+        "translation": np.array(translations, dtype=np.float64).reshape(-1, 3),
+        "key_ti": np.array(key_ti, dtype=np.int64),
+        "is_key": np.array(is_key, dtype=bool),
+    }
+
+
+def load_ego_sweeps(nusc, first_sample_token, cache_dir=None):
+    if cache_dir is None:
+        return collect_ego_sweeps(nusc, first_sample_token)
+    cache_path = os.path.join(cache_dir, "ego", "%s.npz" % (first_sample_token))
+    return load_npz_cached(cache_path, lambda: collect_ego_sweeps(nusc, first_sample_token))
+
+
+def resample_ego_sweeps(sweeps, rate=None):
+    # -> (traj (M, 3), step_ti (M,), times (M,) seconds from the first keyframe).
+    # rate None/<=0 keeps the native sweeps; otherwise a uniform grid at rate Hz,
+    # with the keyframe instants always on it so every sample stays reachable
+    t = (sweeps["timestamp"] - sweeps["timestamp"][0]) / 1e6
+    key_t = t[sweeps["is_key"]]
+    if rate is None or rate <= 0:
+        return sweeps["translation"], sweeps["key_ti"], t
+    grid = np.arange(0.0, t[-1], 1.0 / rate)
+    # drop grid points crowding a keyframe, then insert the keyframes
+    idx = np.searchsorted(key_t, grid)
+    d = np.minimum(np.abs(key_t[np.minimum(idx, len(key_t) - 1)] - grid), np.abs(grid - key_t[np.maximum(idx - 1, 0)]))
+    grid = np.sort(np.concatenate([grid[d > 0.25 / rate], key_t]))
+    traj = np.stack([np.interp(grid, t, sweeps["translation"][:, k]) for k in range(3)], axis=1)
+    step_ti = np.maximum(np.searchsorted(key_t, grid, side="right") - 1, 0)
+    return traj, step_ti, grid
@@ -0,0 +1,115 @@
+import os
+import time
+import json
+import pickle
+import argparse
+import multiprocessing
+import numpy as np
+
+from utils import EgoTF, rasterize_polyline, quaternion_yaw
+from anno_history import LANE_KEYS, HIGH_LEVEL_OPTIONS, proper_ti
+
+# Exports ego-centric raster masks of the annotated lanes for every timestep of
+# every annotated scene:
+#   <out_dir>/masks.npy    uint8 (N, 3, H, W), channels curr/left/right, memory-mapped
+#   <out_dir>/index.json   one row per mask: scene token, timestep, sample token, high-level label
+# The output array is preallocated once; workers write their scenes' rows in place,
+# so memory stays bounded by one scene per worker.
+
+
+def get_scene_poses(nusc, first_sample_token):
+    # (T, 3) ego x, y, yaw and the sample tokens, one per keyframe sample
+    sample_tokens, translations, rotations = [], [], []
+    the_token = first_sample_token
+    while the_token != "":
+        the_sample = nusc.get("sample", the_token)
+        the_lidar_data = nusc.get("sample_data", the_sample['data']["LIDAR_TOP"])
+        pose = nusc.get("ego_pose", the_lidar_data["ego_pose_token"])
+        sample_tokens.append(the_token)
+        translations.append(pose["translation"][:2])
+        rotations.append(pose["rotation"])
+        the_token = the_sample["next"]
+    poses = np.concatenate([np.array(translations), quaternion_yaw(np.array(rotations))[:, None]], axis=1)
+    return poses, sample_tokens
+
+
+def export_scene(job):
+    anno_path, out_path, row0, poses, resolution, size, thickness = job
+    with open(anno_path, "rb") as f:
+        data = pickle.load(f)
+    masks = np.load(out_path, mmap_mode="r+")
+    high_levels = []
+    for ti in range(poses.shape[0]):
+        # latest keyframe at or before ti, as in the annotator
+        frame_ti = proper_ti(data, ti)
+        frame = data[frame_ti] if frame_ti is not None else None
+        mask = np.zeros((len(LANE_KEYS), size, size), dtype=np.uint8)
+        high_levels.append(frame["high_level"] if frame is not None else None)
+        if frame is not None:
+            tf = EgoTF(poses[ti, 0], poses[ti, 1], poses[ti, 2], resolution, size, size)
+            for key_i, key in enumerate(LANE_KEYS):
+                for lane in frame["lanes"][key]:
+                    xs_pixel, ys_pixel = tf.world_to_pixel(lane[-1][:, 0], lane[-1][:, 1])
+                    rasterize_polyline(mask[key_i], xs_pixel, ys_pixel, thickness)
+        masks[row0 + ti] = mask
+    masks.flush()
+    del masks
+    return row0, high_levels
+
+
+def export_masks(nusc, save_dir, out_dir, resolution=0.5, size=200, thickness=3, num_workers=None):
+    scene_d = {scene["first_sample_token"]: scene for scene in nusc.scene}
+    jobs = []
+    rows = []
+    out_path = os.path.join(out_dir, "masks.npy")
+    for fname in sorted(os.listdir(save_dir)):
+        token = fname[:-len(".pickle")]
+        if not fname.endswith(".pickle") or token not in scene_d:
+            continue
+        poses, sample_tokens = get_scene_poses(nusc, token)
+        jobs.append((os.path.join(save_dir, fname), out_path, len(rows), poses, resolution, size, thickness))
+        rows.extend({"scene_token": token, "ti": ti, "sample_token": sample_token} for ti, sample_token in enumerate(sample_tokens))
+
+    os.makedirs(out_dir, exist_ok=True)
+    masks = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8, shape=(len(rows), len(LANE_KEYS), size, size))
+    del masks
+
+    with multiprocessing.Pool(num_workers) as pool:
+        for row0, high_levels in pool.imap_unordered(export_scene, jobs):
+            for ti, high_level in enumerate(high_levels):
+                rows[row0 + ti]["high_level"] = high_level
+                rows[row0 + ti]["high_level_id"] = HIGH_LEVEL_OPTIONS.index(high_level) if high_level in HIGH_LEVEL_OPTIONS else -1
+
+    index = {
+        "shape": [len(rows), len(LANE_KEYS), size, size],
+        "channels": LANE_KEYS,
+        "resolution": resolution,
+        "high_level_options": HIGH_LEVEL_OPTIONS,
+        "rows": rows,
+    }
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+    return len(jobs), len(rows)
+
+
+if __name__ == "__main__":
+    from nuscenes.nuscenes import NuScenes
+    parser = argparse.ArgumentParser("NuScenes lane mask exporter")
+    parser.add_argument("--nuscenes_data_dir", type=str, default="../../dataset")
+    parser.add_argument("--nuscenes_save_dir", type=str, default="./saved_data")
+    parser.add_argument("--out_dir", type=str, default="./mask_data")
+    parser.add_argument("--use_mini", action='store_true', default=False)
+    parser.add_argument("--resolution", type=float, default=0.5, help="meters per pixel")
+    parser.add_argument("--size", type=int, default=200, help="mask height/width in pixels")
+    parser.add_argument("--thickness", type=int, default=3, help="lane stroke in pixels")
+    parser.add_argument("--num_workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.use_mini:
+        nusc = NuScenes(version='v1.0-mini', dataroot=os.path.join(args.nuscenes_data_dir, 'nuscenes_mini'), verbose=False)
+    else:
+        nusc = NuScenes(version='v1.0-trainval', dataroot=os.path.join(args.nuscenes_data_dir, 'nuscenes'), verbose=False)
+    tt1 = time.time()
+    n_scenes, n_rows = export_masks(nusc, args.nuscenes_save_dir, args.out_dir, args.resolution, args.size,
+                                    args.thickness, args.num_workers)
+    print("Exported %d masks from %d scenes to %s in %.3f seconds" % (n_rows, n_scenes, args.out_dir, time.time() - tt1))
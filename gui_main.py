@@ -5,39 +5,58 @@ import time
 import argparse
 import numpy as np
 import pickle
-from PyQt5.QtCore import Qt, QRectF, pyqtSignal, QPointF, QRect
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QRectF, pyqtSignal, QPointF, QRect, QTimer
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, \
     QCheckBox, QLabel, QGraphicsView, QGraphicsScene, QGraphicsRectItem, QGraphicsEllipseItem,\
     QSlider, QListView, QTableView, QSizePolicy, QGraphicsPixmapItem, QFrame, QTextEdit, QRadioButton,\
     QButtonGroup, QTabWidget, QTableWidget, QTableWidgetItem, QComboBox, QAbstractItemView,\
-    QMessageBox
+    QMessageBox, QGraphicsPathItem, QShortcut, QLineEdit
 
 from PyQt5.QtGui import QIcon,QPainter, QBrush, QColor, QPixmap, QImage, QStandardItemModel,\
-    QStandardItem, QPen
+    QStandardItem, QPen, QPainterPath, QKeySequence
 
-from nuscenes.nuscenes import NuScenes
-from nuscenes.map_expansion.map_api import NuScenesMap
 from nuscenes.map_expansion import arcline_path_utils
 from nuscenes.map_expansion.bitmap import BitMap
 
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
 import signal
 signal.signal(signal.SIGINT, signal.SIG_DFL)
 
-from utils import MyTF, MyPainter, remove_qimage_margin, get_lanes_nearby, visualize_nuscenes_scene, visualize_nuscenes_legends
+from utils import MyPainter, render_nuscenes_scene,\
+    LaneGeomCache, lod_tolerance, load_scene_boxes, box_corners, box_color_group, load_lidar_bev
+from anno_store import AnnoStore
+from anno_session import AnnotationSession
+from anno_history import LANE_KEYS, HIGH_LEVEL_OPTIONS
+from camera_panel import CameraPanel, get_scene_camera_paths
+from overview import OverviewWidget, collect_annotated_lanes, collect_map_lanes
+from scene_index import SceneIndex
 
 class CanvasWidget(QGraphicsView):
     photoClicked = pyqtSignal(QPointF)
     doubleClicked = pyqtSignal(QPointF)
-    def __init__(self):
+    zoomChanged = pyqtSignal()
+    hovered = pyqtSignal(QPointF)
+    def __init__(self, hover_interval_ms=30):
         super().__init__()
         self._zoom = 0
         self._empty = True
         self._scene = QGraphicsScene(self)
         self._photo = QGraphicsPixmapItem()
         self._scene.addItem(self._photo)
+        # hover highlight is an overlay item, so it never re-renders the pixmap
+        self._hover_item = QGraphicsPathItem()
+        self._hover_item.setPen(QPen(QColor(0, 200, 0, 200), 9, Qt.SolidLine, Qt.RoundCap))
+        self._hover_item.setZValue(1)
+        self._scene.addItem(self._hover_item)
+        # mouse moves are throttled: at most one hovered() per interval, with the latest position
+        self._hover_enabled = False
+        self._hover_pos = None
+        self._hover_timer = QTimer(self)
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.setInterval(hover_interval_ms)
+        self._hover_timer.timeout.connect(self._emit_hovered)
         self.setScene(self._scene)
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.setResizeAnchor(QGraphicsView.AnchorUnderMouse)
@@ -64,7 +83,9 @@ class CanvasWidget(QGraphicsView):
             self._zoom = 0
     
     def setPhoto(self, pixmap=None, dont_fit_view=False):
-        self._zoom = 0
+        # redrawing in place keeps the current zoom level
+        if not dont_fit_view:
+            self._zoom = 0
         if pixmap and not pixmap.isNull():
             self._empty = False
             self.setDragMode(QGraphicsView.ScrollHandDrag)
@@ -90,6 +111,11 @@ class CanvasWidget(QGraphicsView):
                 self.fitInView()
             else:
                 self._zoom = 0
+                return
+            self.zoomChanged.emit()
+
+    def viewScale(self):
+        return self.transform().m11()
 
     def toggleDragMode(self):
         if self.dragMode() == QGraphicsView.ScrollHandDrag:
@@ -100,6 +126,32 @@ class CanvasWidget(QGraphicsView):
     def getPixMapCoord(self, pos):
         return self.mapToScene(pos)
 
+    def setHoverEnabled(self, enabled):
+        self._hover_enabled = enabled
+        self.setMouseTracking(enabled)
+        if not enabled:
+            self._hover_timer.stop()
+            self.setHoverLine(None, None)
+
+    def setHoverLine(self, xs_pixel, ys_pixel):
+        path = QPainterPath()
+        if xs_pixel is not None and len(xs_pixel) > 0:
+            path.moveTo(xs_pixel[0], ys_pixel[0])
+            for xxx, yyy in zip(xs_pixel[1:], ys_pixel[1:]):
+                path.lineTo(xxx, yyy)
+        self._hover_item.setPath(path)
+
+    def _emit_hovered(self):
+        if self._hover_pos is not None:
+            self.hovered.emit(self._hover_pos)
+
+    def mouseMoveEvent(self, event):
+        if self._hover_enabled and self.hasPhoto():
+            self._hover_pos = self.getPixMapCoord(event.pos())
+            if not self._hover_timer.isActive():
+                self._hover_timer.start()
+        super(CanvasWidget, self).mouseMoveEvent(event)
+
     def mousePressEvent(self, event):
         if self._photo.isUnderMouse():
             self.photoClicked.emit(self.getPixMapCoord(event.pos()).toPoint())
@@ -117,14 +169,19 @@ class MyGUIApp:
         self.setup_ui()    
         
         # model variables
-        # cache related
+        # cache related (renders only; annotations live in the session)
         self.cache = {}
-        self.annotated_data = {0:{"high_level": None, "lanes":{"curr":[], "left":[], "right":[]}}}
         self.qimage_cache = None
+        self.lane_cache = LaneGeomCache()
+        
+        self.agent_color = {
+            "vehicle": QColor(255, 140, 0, 220),
+            "human": QColor(220, 20, 60, 220),
+            "animal": QColor(139, 69, 19, 220),
+            "object": QColor(128, 128, 128, 220)}
         
         self.is_loaded = False
         self.ctrl_pressed = False
-        self.cur_ti = None        
         self.hover_x = None
         self.hover_y = None
         self.ego_x_pixel = None
@@ -134,10 +191,36 @@ class MyGUIApp:
         self.highlighted_tracked_lane = None
         self.highlighted_tracked_lane_at = 0
         self.current_label_key = "curr"
-        self.curr_token = None
+        self.lane_index = None
+        self.hover_lane = None
+        self.scene_boxes = None
+        self.lidar_cache = OrderedDict()
+        self.render_lru = OrderedDict()
+        self.map_lane_layers = {}
+        self.overview_widget = None
 
         os.makedirs(args.nuscenes_save_dir, exist_ok=True)
         os.makedirs(args.nuscenes_preview_dir, exist_ok=True)
+        os.makedirs(args.nuscenes_cache_dir, exist_ok=True)
+
+        # shared annotation store (per-scene leases + change feed)
+        self.store = AnnoStore(args.nuscenes_save_dir, lease_ttl=args.lease_ttl)
+        self.record_row_d = {}
+        self.store_timer = QTimer()
+        self.store_timer.setInterval(args.store_poll_ms)
+        self.store_timer.timeout.connect(self.on_store_timer)
+        self.lease_renew_t = 0
+
+        # record filter: inverted index over scene metadata and saved annotations,
+        # the annotations are indexed a batch per timer tick after loading
+        self.scene_index = SceneIndex()
+        self.index_pending = []
+        self.index_timer = QTimer()
+        self.index_timer.setInterval(0)
+        self.index_timer.timeout.connect(self.on_index_timer)
+
+        # headless annotation engine; this class only maps widgets onto it
+        self.session = AnnotationSession(self.store, self.lane_cache, ego_rate=args.ego_rate, cache_dir=args.nuscenes_cache_dir)
     
     def setup_ui(self):
         self.app = QApplication(sys.argv)
@@ -164,12 +247,22 @@ class MyGUIApp:
         self.checkbox_viz_left.setChecked(True)
         self.checkbox_viz_right = QCheckBox('Right')
         self.checkbox_viz_right.setChecked(True)
+        self.checkbox_viz_agents = QCheckBox('Agents')
+        self.checkbox_viz_agents.setChecked(True)
+        self.checkbox_viz_lidar = QCheckBox('LiDAR')
+        self.checkbox_viz_lidar.setChecked(False)
+        self.checkbox_cameras = QCheckBox('Cameras')
+        self.checkbox_cameras.setChecked(True)
+        self.checkbox_hover = QCheckBox('Hover')
+        self.checkbox_hover.setToolTip("Highlight the nearest lane under the cursor; ctrl-click labels it")
     
         self.button_group_checkbox_viz = QButtonGroup()
         self.button_group_checkbox_viz.setExclusive(False)
         self.button_group_checkbox_viz.addButton(self.checkbox_viz_curr)
         self.button_group_checkbox_viz.addButton(self.checkbox_viz_left)
         self.button_group_checkbox_viz.addButton(self.checkbox_viz_right)
+        self.button_group_checkbox_viz.addButton(self.checkbox_viz_agents)
+        self.button_group_checkbox_viz.addButton(self.checkbox_viz_lidar)
 
         # create radio buttons
         self.label_label = QLabel("Label for...")
@@ -185,12 +278,14 @@ class MyGUIApp:
         
         # buttons
         self.combobox_highlevel = QComboBox()
-        self.options = ["Lane-keeping", "Left-lane-change", "Right-lane-change", "Stop sign", "Traffic light"]
+        self.options = HIGH_LEVEL_OPTIONS
         self.reverse_high_level_d = {k:i for i,k in enumerate(self.options)}
         self.reverse_high_level_d[None]=0
         self.combobox_highlevel.addItems(self.options)
         self.button_load_data = QPushButton("Load Nuscenes")
         self.button_load_annotation = QPushButton("Load Anno.")
+        self.button_overview = QPushButton("Overview")
+        self.button_overview.setToolTip("All annotated lanes of this location; double-click a lane to open its scene")
         self.button_save_data = QPushButton("Save Anno.")
         self.button_load_data.setFixedWidth(width0)
         self.button_save_data.setFixedWidth(width0)
@@ -202,6 +297,8 @@ class MyGUIApp:
         self.button_move_down = QPushButton("Down")
         self.button_keyframe_add = QPushButton("Add frame")
         self.button_keyframe_del = QPushButton("Del frame")
+        self.button_undo = QPushButton("Undo")
+        self.button_redo = QPushButton("Redo")
         self.button_group_clear = QButtonGroup()
         self.button_group_clear.addButton(self.button_clear)
         self.button_group_clear.addButton(self.button_clear_all)
@@ -212,6 +309,9 @@ class MyGUIApp:
         self.button_group_keyframe = QButtonGroup()
         self.button_group_keyframe.addButton(self.button_keyframe_add)
         self.button_group_keyframe.addButton(self.button_keyframe_del)
+        self.button_group_history = QButtonGroup()
+        self.button_group_history.addButton(self.button_undo)
+        self.button_group_history.addButton(self.button_redo)
 
         self.button_clear.setFixedWidth(width1 / 2.5)
         self.button_clear_all.setFixedWidth(width1 / 2.5)
@@ -220,9 +320,12 @@ class MyGUIApp:
         self.button_move_down.setFixedWidth(width1 / 3.2)
         self.button_keyframe_add.setFixedWidth(width1 / 2.5)
         self.button_keyframe_del.setFixedWidth(width1 / 2.5)
+        self.button_undo.setFixedWidth(width1 / 2.5)
+        self.button_redo.setFixedWidth(width1 / 2.5)
 
         self.canvas_widget = CanvasWidget()
         self.canvas_widget.setFixedSize(800, 800)
+        self.camera_panel = CameraPanel()
 
         self.label_legend = QLabel('')
         self.textedit_stats = QTextEdit()
@@ -230,6 +333,12 @@ class MyGUIApp:
         self.tableview_records.setSizePolicy(width1, QSizePolicy.Expanding)
         self.tableview_records.setFixedWidth(width1)
         self.model_records = QStandardItemModel()
+        self.lineedit_filter = QLineEdit()
+        self.lineedit_filter.setFixedWidth(width1)
+        self.lineedit_filter.setPlaceholderText("Filter, e.g. singapore unlabeled")
+        self.lineedit_filter.setToolTip("Words are ANDed and match location, status, token, high level or lane token.\n"
+                                        "field:value restricts a word (loc, status, hl, kf, lane, log, token), -word negates it.\n"
+                                        "e.g. hl:left-lane-change lane:<token>, status:done kf:>3")
 
         self.tableview_lane_tokens = QTableView()
         self.model_lane_tokens = QStandardItemModel()
@@ -271,6 +380,7 @@ class MyGUIApp:
         self.button_group_keyframe_layout = QHBoxLayout()
         self.button_group_clear_layout = QHBoxLayout()
         self.button_group_move_layout = QHBoxLayout()
+        self.button_group_history_layout = QHBoxLayout()
 
         self.window.setLayout(self.layout)
         self.layout.addLayout(self.main_layout)
@@ -281,9 +391,11 @@ class MyGUIApp:
         self.main_layout.addLayout(self.panel_layout)    
 
         self.info_layout.addLayout(self.slider_layout)
+        self.info_layout.addWidget(self.camera_panel)
         self.info_layout.addLayout(self.stats_layout)    
         
         self.stats_record_layout.addWidget(self.record_label)
+        self.stats_record_layout.addWidget(self.lineedit_filter)
         self.stats_record_layout.addWidget(self.tableview_records)
         self.stats_record_layout.addWidget(self.lane_tokens_label)
         self.stats_record_layout.addWidget(self.tableview_lane_tokens)        
@@ -303,6 +415,10 @@ class MyGUIApp:
         self.button_group_move_layout.addWidget(self.button_move_up)
         self.button_group_move_layout.addWidget(self.button_move_down)
         self.stats_record_layout.addLayout(self.button_group_move_layout)
+
+        self.button_group_history_layout.addWidget(self.button_undo)
+        self.button_group_history_layout.addWidget(self.button_redo)
+        self.stats_record_layout.addLayout(self.button_group_history_layout)
         self.stats_record_layout.addWidget(self.tableview_tracked)
 
         self.canvas_layout.addWidget(self.canvas_label, alignment=Qt.AlignTop)
@@ -316,6 +432,10 @@ class MyGUIApp:
         self.panel_layout.addWidget(self.checkbox_viz_curr)
         self.panel_layout.addWidget(self.checkbox_viz_left)
         self.panel_layout.addWidget(self.checkbox_viz_right)
+        self.panel_layout.addWidget(self.checkbox_viz_agents)
+        self.panel_layout.addWidget(self.checkbox_viz_lidar)
+        self.panel_layout.addWidget(self.checkbox_cameras)
+        self.panel_layout.addWidget(self.checkbox_hover)
         self.panel_layout.addWidget(self.label_label)
         self.panel_layout.addLayout(self.radio_group_layout)
         self.radio_group_layout.addWidget(self.radio_button1)
@@ -323,6 +443,7 @@ class MyGUIApp:
         self.radio_group_layout.addWidget(self.radio_button3)
         self.panel_layout.addStretch()
         self.panel_layout.addWidget(self.button_load_annotation)
+        self.panel_layout.addWidget(self.button_overview)
         self.panel_layout.addStretch()
         self.panel_layout.addWidget(self.button_save_data)
         self.panel_layout.addStretch()
@@ -338,19 +459,31 @@ class MyGUIApp:
         self.window.keyReleaseEvent = self.keyReleaseEvent
         self.canvas_widget.doubleClicked.connect(self.on_canvas_double_clicked)
         self.canvas_widget.photoClicked.connect(self.on_canvas_clicked)
+        self.canvas_widget.zoomChanged.connect(self.update_scene_func)
+        self.canvas_widget.hovered.connect(self.on_canvas_hovered)
+        self.checkbox_hover.toggled.connect(self.on_checkbox_hover_toggled)
+        self.checkbox_cameras.toggled.connect(self.on_checkbox_cameras_toggled)
         self.button_load_data.clicked.connect(self.on_button_load_data_clicked)
         self.button_load_annotation.clicked.connect(self.on_button_load_annotation_clicked)
+        self.button_overview.clicked.connect(self.on_button_overview_clicked)
         self.button_save_data.clicked.connect(self.on_button_save_data_clicked)
         self.button_group.buttonClicked.connect(self.handleRadioButtonChange)
         self.button_group_clear.buttonClicked.connect(self.on_button_group_clear_clicked)
         self.button_group_move.buttonClicked.connect(self.on_button_group_move_clicked)
         self.button_group_keyframe.buttonClicked.connect(self.on_button_group_keyframe_clicked)
+        self.button_group_history.buttonClicked.connect(self.on_button_group_history_clicked)
+        self.shortcut_undo = QShortcut(QKeySequence.Undo, self.window)
+        self.shortcut_undo.activated.connect(self.button_undo.click)
+        self.shortcut_redo = QShortcut(QKeySequence.Redo, self.window)
+        self.shortcut_redo.activated.connect(self.button_redo.click)
         self.tableview_records.clicked.connect(self.on_tableview_record_clicked)
+        self.lineedit_filter.textChanged.connect(self.apply_record_filter)
         self.tableview_lane_tokens.clicked.connect(self.on_tableview_lane_tokens_clicked)
         self.tableview_tracked.clicked.connect(self.on_tableview_tracked_clicked)
         self.button_group_checkbox_viz.buttonClicked.connect(self.update_scene_func)
         self.slider_ego_state.valueChanged.connect(self.slider_ego_state_value_changed)
         self.combobox_highlevel.currentIndexChanged.connect(self.update_highlevel_label)
+        self.app.aboutToQuit.connect(self.on_app_quit)
 
 
     def keyPressEvent(self, event):
@@ -369,15 +502,29 @@ class MyGUIApp:
 
     def update_highlevel_label(self, index):
         if self.is_loaded:
-            self.get_proper_frame()["high_level"] = self.options[index]
+            self.session.set_high_level(self.options[index])
             self.textedit_stats.setText("Label highlevel as:%s"%(self.options[index]))
 
     def update_scene_func(self):
         self.update_scene()
 
+    def plot_lane(self, lane, pen, arrow, lod_tol):
+        # lane is (dist, token, dense points); draw the level-of-detail polyline
+        points = self.lane_cache.get_lod(lane[1], lane[-1], lod_tol)
+        xs_pixel, ys_pixel = self.my_tf.world_to_pixel(points[:,0], points[:,1])
+        self.my_painter.plot_line(xs_pixel, ys_pixel, pen=pen, arrow=arrow)
+
     def update_scene(self, data=None):
         if self.is_loaded:
             self.my_painter = MyPainter(self.qimage_cache)
+            lod_tol = lod_tolerance(self.my_tf, self.canvas_widget.viewScale())
+
+            # plot the lidar sweep below everything else
+            if self.checkbox_viz_lidar.isChecked():
+                points = self.get_lidar_points(self.session.cur_ti)
+                if points is not None:
+                    xs_pixel, ys_pixel = self.my_tf.world_to_pixel(points[:,0], points[:,1])
+                    self.my_painter.plot_points(xs_pixel, ys_pixel, QColor(80, 80, 80, 160), 2)
             
             # plot ego vehicle
             if self.ego_x_pixel != None:
@@ -391,14 +538,12 @@ class MyGUIApp:
             if self.plot_lanes is not None:
                 pen = QPen(QColor(153, 0, 53, 183), 5, Qt.SolidLine, cap=Qt.RoundCap)
                 for lane in self.plot_lanes:
-                    xs_pixel, ys_pixel = self.my_tf.world_to_pixel(lane[-1][:,0], lane[-1][:,1])
-                    self.my_painter.plot_line(xs_pixel, ys_pixel, pen=pen, arrow=True)
+                    self.plot_lane(lane, pen, True, lod_tol)
         
             # plot the highlighted selected lines
             if self.highlighted_lane is not None:
                 pen = QPen(QColor(23, 0, 153, 183), 7, Qt.SolidLine, cap=Qt.RoundCap)
-                xs_pixel, ys_pixel = self.my_tf.world_to_pixel(self.highlighted_lane[-1][:,0], self.highlighted_lane[-1][:,1])
-                self.my_painter.plot_line(xs_pixel, ys_pixel, pen=pen, arrow=True)
+                self.plot_lane(self.highlighted_lane, pen, True, lod_tol)
             
             # plot the tracked/annotated lines
             lane_color = {
@@ -415,8 +560,7 @@ class MyGUIApp:
                     pen = QPen(lane_color[key], 12, Qt.SolidLine, cap=Qt.RoundCap)
                     tracked_lanes = self.get_proper_frame(data)["lanes"]
                     for lane_i, lane in enumerate(tracked_lanes[key]):
-                        xs_pixel, ys_pixel = self.my_tf.world_to_pixel(lane[-1][:,0], lane[-1][:,1])
-                        self.my_painter.plot_line(xs_pixel, ys_pixel, pen=pen, arrow=(lane_i==len(tracked_lanes[key])-1))
+                        self.plot_lane(lane, pen, lane_i==len(tracked_lanes[key])-1, lod_tol)
 
             # plot the highlighted annotated lines from the table
             lane_color_heavy = [
@@ -425,76 +569,143 @@ class MyGUIApp:
                 QColor(255, 255, 0, 230)]
             if self.highlighted_tracked_lane:
                 pen = QPen(lane_color_heavy[self.highlighted_tracked_lane_at], 16, Qt.SolidLine, cap=Qt.RoundCap)
-                xs_pixel, ys_pixel = self.my_tf.world_to_pixel(self.highlighted_tracked_lane[-1][:,0], self.highlighted_tracked_lane[-1][:,1])
-                self.my_painter.plot_line(xs_pixel, ys_pixel, pen=pen, arrow=True)
+                self.plot_lane(self.highlighted_tracked_lane, pen, True, lod_tol)
+
+            # plot the surrounding agents at the current timestep
+            if self.checkbox_viz_agents.isChecked():
+                self.plot_agents()
 
             # plot the scribbled lines
             self.canvas_widget.setPhoto(self.my_painter.pixmap, dont_fit_view=True)
 
+            # only mirror the label, the sync must not record an edit
             highlevel = self.get_proper_frame(data)["high_level"]
+            self.combobox_highlevel.blockSignals(True)
             self.combobox_highlevel.setCurrentIndex(self.reverse_high_level_d[highlevel])
+            self.combobox_highlevel.blockSignals(False)
+
+    def get_lidar_points(self, ti):
+        # world-frame decimated sweeps, LRU over (scene, timestep)
+        if ti is None or ti >= len(self.session.sample_tokens):
+            return None
+        key = (self.session.token, ti)
+        if key in self.lidar_cache:
+            self.lidar_cache.move_to_end(key)
+        else:
+            self.lidar_cache[key] = load_lidar_bev(self.session.nusc, self.session.sample_tokens[ti], budget=args.lidar_budget)
+            while len(self.lidar_cache) > 64:
+                self.lidar_cache.popitem(last=False)
+        return self.lidar_cache[key]
+
+    def plot_agents(self):
+        boxes = self.scene_boxes
+        if boxes is None or self.session.cur_ti is None or self.session.cur_ti + 1 >= boxes["offsets"].shape[0]:
+            return
+        i0, i1 = boxes["offsets"][self.session.cur_ti], boxes["offsets"][self.session.cur_ti + 1]
+        if i1 <= i0:
+            return
+        corners = box_corners(boxes["center"][i0:i1], boxes["size"][i0:i1], boxes["yaw"][i0:i1])
+        xs_pixel, ys_pixel = self.my_tf.world_to_pixel(corners[..., 0], corners[..., 1])
+        corners_pixel = np.stack([xs_pixel, ys_pixel], axis=-1)
+        # one batched draw per color group
+        groups = np.array([box_color_group(name) for name in boxes["categories"]])[boxes["category"][i0:i1]]
+        for group, color in self.agent_color.items():
+            mask = groups == group
+            if np.any(mask):
+                fill = QColor(color)
+                fill.setAlpha(70)
+                self.my_painter.plot_rects(corners_pixel[mask], color, 2, fill=fill)
 
     def update_table(self, data=None):       
         self.tableview_tracked.clearContents()
         tracked_lanes = self.get_proper_frame(data)["lanes"]
-        for key_i, key in enumerate(["curr", "left", "right"]):
+        for key_i, key in enumerate(LANE_KEYS):
             for lane_i, lane in enumerate(tracked_lanes[key]):
                 self.tableview_tracked.setItem(lane_i, key_i, QTableWidgetItem(lane[1]))
         self.tableview_tracked.update()
 
     def slider_ego_state_value_changed(self):
         if self.is_loaded:
-            self.cur_ti = self.slider_ego_state.value()
+            self.session.set_step(self.slider_ego_state.value())
             
-            if self.cur_ti==0:
+            if self.session.cur_ti==0:
                 self.button_keyframe_add.setEnabled(False)
                 self.button_keyframe_del.setEnabled(False)
             else:
-                if self.cur_ti in sorted(self.annotated_data.keys()):
+                if self.session.is_keyframe():
                     self.button_keyframe_add.setEnabled(False)
                     self.button_keyframe_del.setEnabled(True)
                 else:
                     self.button_keyframe_add.setEnabled(True)
                     self.button_keyframe_del.setEnabled(False)
-            self.slider_label.setText(f'Timestep: {self.cur_ti}')
-            state = self.ego_traj[self.cur_ti]
+            if self.session.lease_owner is not None:
+                self.button_keyframe_add.setEnabled(False)
+                self.button_keyframe_del.setEnabled(False)
+            if self.session.num_steps() > len(self.session.sample_tokens):
+                self.slider_label.setText(f'Timestep: {self.session.cur_ti} (step {self.session.cur_step})')
+            else:
+                self.slider_label.setText(f'Timestep: {self.session.cur_ti}')
+            state = self.session.ego_state()
             self.ego_x_pixel, self.ego_y_pixel = self.my_tf.world_to_pixel(state[0], state[1])
+            if self.checkbox_cameras.isChecked():
+                self.camera_panel.show_timestep(self.session.cur_ti)
             self.update_scene()
             self.update_table()
 
     def on_canvas_clicked(self, point):
         if self.is_loaded:
             x, y = self.my_tf.pixel_to_world(point.x(), point.y())
-            pt = np.array([[x, y]])
             if self.plot_lanes is not None and len(self.plot_lanes)>0:
-                d_min = 100000
-                lane_min = None
-                id_min = None
                 self.textedit_stats.setText("current cursor:%.3f %.3f"%(x, y))
-                for lane_i, lane in enumerate(self.plot_lanes):
-                    d = np.min(np.linalg.norm(lane[-1][:,:2]-pt, axis=1))
-                    if d < 4:
-                        if d < d_min:
-                            d_min = d
-                            lane_min = lane
-                            id_min = lane_i
-                col_idx_dict={"curr":0, "left":1, "right":2}
-                if lane_min is not None:
-                    self.highlighted_lane = lane_min
+            # hover mode: the scene lane index (what is highlighted) wins over the last query results
+            use_index = self.checkbox_hover.isChecked() and self.lane_index is not None
+            lane_min, id_min = self.session.pick_lane(x, y, self.plot_lanes, use_index=use_index)
+            if lane_min is not None:
+                self.highlighted_lane = lane_min
+                if id_min is not None:
                     self.tableview_lane_tokens.selectRow(id_min)
-                    if self.ctrl_pressed:
-                        key = self.current_label_key
-                        tracked_lanes = self.get_proper_frame()["lanes"]
-                        tracked_token_names = [xx[1] for xx in tracked_lanes[key]]
-                        if lane_min[1] not in tracked_token_names:
-                            tracked_lanes[key].append(lane_min)
-                        else:
-                            for ii in range(len(tracked_lanes[key])):
-                                if tracked_lanes[key][ii][1] == lane_min[1]:
-                                    break
-                            del tracked_lanes[key][ii]
-                    self.update_scene()
-                    self.update_table()
+                if self.ctrl_pressed:
+                    self.session.toggle_lane(self.current_label_key, lane_min)
+                self.update_scene()
+                self.update_table()
+
+    def on_checkbox_cameras_toggled(self, checked):
+        self.camera_panel.setVisible(checked)
+        if checked and self.is_loaded:
+            self.camera_panel.show_timestep(self.session.cur_ti)
+
+    def on_checkbox_hover_toggled(self, checked):
+        self.hover_lane = None
+        if checked and self.is_loaded:
+            self.ensure_lane_index()
+        self.canvas_widget.setHoverEnabled(checked)
+        self.canvas_label.setText('Scene Canvas')
+
+    def ensure_lane_index(self):
+        # one index per scene, covering the rendered patch
+        if self.lane_index is None:
+            tt1 = time.time()
+            patch = (self.my_tf.xmin, self.my_tf.ymin, self.my_tf.xmax, self.my_tf.ymax)
+            self.lane_index = self.session.get_lane_index(patch)
+            print("Lane index took %.3f seconds"%(time.time()-tt1))
+
+    def on_canvas_hovered(self, point):
+        if self.is_loaded and self.lane_index is not None:
+            tt1 = time.time()
+            x, y = self.my_tf.pixel_to_world(point.x(), point.y())
+            hit = self.lane_index.query(x, y, max_dist=4)
+            if hit is None:
+                if self.hover_lane is not None:
+                    self.canvas_widget.setHoverLine(None, None)
+                self.hover_lane = None
+                self.canvas_label.setText('Scene Canvas')
+                return
+            if self.hover_lane is None or self.hover_lane[1] != hit[1]:
+                points = self.lane_cache.get_lod(hit[1], hit[-1], lod_tolerance(self.my_tf, self.canvas_widget.viewScale()))
+                xs_pixel, ys_pixel = self.my_tf.world_to_pixel(points[:,0], points[:,1])
+                self.canvas_widget.setHoverLine(xs_pixel, ys_pixel)
+            self.hover_lane = hit
+            self.canvas_label.setText("Hover: %s  dist:%.2fm  (%.2fms)"%(hit[1], hit[0], (time.time()-tt1)*1000))
 
     def on_canvas_double_clicked(self, point):
         if self.is_loaded:
@@ -506,7 +717,7 @@ class MyGUIApp:
             # check lane records
             x, y = self.my_tf.pixel_to_world(self.hover_x, self.hover_y)
             tt1=time.time()
-            self.plot_lanes = get_lanes_nearby(self.nusc_map, x, y, radius=6)
+            self.plot_lanes = self.session.query_lanes(x, y, radius=6)
             print("Query took %.3f seconds"%(time.time()-tt1))
             
             # listview records
@@ -521,22 +732,30 @@ class MyGUIApp:
             self.highlighted_lane = None
             self.update_scene()
 
-    def get_proper_frame(self, data=None):
-        for ti in range(self.cur_ti,-1,-1):
-            if data is not None:
-                if ti in data:
-                    return data[ti]
+    def on_button_group_history_clicked(self, button):
+        if self.is_loaded:
+            if button.text() == "Undo":
+                label = self.session.undo()
+            elif button.text() == "Redo":
+                label = self.session.redo()
             else:
-                if ti in self.annotated_data:
-                    return self.annotated_data[ti]    
+                raise NotImplementedError
+            if label is None:
+                return
+            self.highlighted_tracked_lane = None
+            self.highlighted_tracked_lane_at = 0
+            self.textedit_stats.setText("%s: %s"%(button.text(), label))
+            self.slider_ego_state_value_changed()
+
+    def get_proper_frame(self, data=None):
+        return self.session.frame(data=data)
 
     def on_button_group_clear_clicked(self, button):
         if self.is_loaded:
-            keyframe = self.get_proper_frame()
             if button.text() == "Clear":
-                keyframe["lanes"][self.current_label_key] = []
+                self.session.clear([self.current_label_key])
             elif button.text() == "Clear all":
-                keyframe["lanes"] = {"curr":[], "left":[], "right":[]}
+                self.session.clear()
             self.highlighted_tracked_lane = None
             self.highlighted_tracked_lane_at = 0
             self.update_scene()
@@ -548,44 +767,26 @@ class MyGUIApp:
             mode = button.text()
             if selected_items:
                 assert len(selected_items)==1
-                key_list=["curr", "left", "right"]
                 for item in selected_items:
                     lane_token = self.tableview_tracked.item(item.row(), item.column()).text()
                     if lane_token is not None and len(lane_token)>0:
-                        key = key_list[item.column()]
-                        tracked_lanes_key = self.get_proper_frame()["lanes"][key]
-                        for i,lane in enumerate(tracked_lanes_key):
-                            if lane[1] == lane_token:
-                                if mode=="Del":
-                                    del tracked_lanes_key[i]
-                                elif mode=="Up":
-                                    if i!=0:
-                                        tracked_lanes_key[i], tracked_lanes_key[i-1] = tracked_lanes_key[i-1], tracked_lanes_key[i]
-                                elif mode=="Down":
-                                    if i!=len(tracked_lanes_key)-1:
-                                        tracked_lanes_key[i], tracked_lanes_key[i+1] = tracked_lanes_key[i+1], tracked_lanes_key[i]
-                                else:
-                                    raise NotImplementedError
-                                break
+                        self.session.move_lane(LANE_KEYS[item.column()], lane_token, mode)
             self.update_scene()
             self.update_table()
 
     def on_button_group_keyframe_clicked(self, button):
         if self.is_loaded:
             if button.text()=="Add frame":
-                self.annotated_data[self.cur_ti]={"high_level": None, "lanes":{"curr":[], "left":[], "right":[]}}
-                print("Now annotated frames are", self.annotated_data.keys())
+                self.session.add_keyframe()
+                print("Now annotated frames are", self.session.data.keys())
                 self.button_keyframe_add.setEnabled(False)
                 self.button_keyframe_del.setEnabled(True)
             elif button.text()=="Del frame":
-                del self.annotated_data[self.cur_ti]
-                for ti in range(self.cur_ti-1,-1,-1):
-                    if ti in self.annotated_data:
-                        break
+                self.session.del_keyframe()
                 self.button_keyframe_add.setEnabled(True)
                 self.button_keyframe_del.setEnabled(False)
                 
-                print("Now annotated frames are", self.annotated_data.keys())
+                print("Now annotated frames are", self.session.data.keys())
             else:
                 raise NotImplementedError
             self.update_scene()
@@ -593,27 +794,10 @@ class MyGUIApp:
     
     # load the nuscenes data
     def on_button_load_data_clicked(self):
-        if self.checkbox_use_mini.isChecked():
-            version='v1.0-mini'
-            dataroot=os.path.join(args.nuscenes_data_dir, 'nuscenes_mini')
-        else:
-            version='v1.0-trainval'
-            dataroot=os.path.join(args.nuscenes_data_dir, 'nuscenes')
-        nusc = NuScenes(version=version, dataroot=dataroot, verbose=True)
-        nusc_map_d={}
-        location_list=["boston-seaport", "singapore-hollandvillage", "singapore-queenstown", "singapore-onenorth"]
-        for map_name in location_list:
-            nusc_map_d[map_name] = NuScenesMap(os.path.join(args.nuscenes_data_dir, 'nuscenes'), map_name=map_name)
-        self.nusc = nusc
-        self.nusc_map_d = nusc_map_d
-        self.location_list = location_list
+        self.session.load_dataset(args.nuscenes_data_dir, self.checkbox_use_mini.isChecked())
 
         # update the record tokens
-        scene_list = []
-        for scene_id,scene in enumerate(self.nusc.scene):
-            log = self.nusc.get("log", scene["log_token"])
-            the_token = scene["first_sample_token"]
-            scene_list.append([str(the_token), str(scene["log_token"]), str(log["location"])])
+        scene_list = self.session.scene_rows()
 
         print("Scene_list length:", len(scene_list))
         self.model_records.setHorizontalHeaderLabels(['Scene token0', 'Log token', 'Location'])
@@ -624,14 +808,18 @@ class MyGUIApp:
         self.tableview_records.setModel(self.model_records)
         self.tableview_records.update()
 
+        self.store.scan()
+        self.record_row_d = {item_tuple[0]:item_i for item_i, item_tuple in enumerate(scene_list)}
+        self.scene_index.load_cache(self.scene_index_path())
         for item_i, item_tuple in enumerate(scene_list):
-            if os.path.exists("%s/%s.pickle"%(args.nuscenes_save_dir, item_tuple[0])):
-                self.bold_row(item_i)
+            self.scene_index.add_scene(item_i, *item_tuple)
+            self.refresh_record_row(item_tuple[0])
+        self.index_pending = [self.record_row_d[token] for token in self.store.done if token in self.record_row_d]
+        self.index_timer.start()
+        self.store_timer.start()
 
         self.button_load_data.setEnabled(False)
         self.is_loaded = True
-        self.curr_token = None
-        self.scene_id = None
         self.hover_x = None
         self.hover_y = None
         self.ego_x_pixel = None
@@ -647,84 +835,148 @@ class MyGUIApp:
 
     def viz_scene(self, scene_id=0, ti=0):
         # render the first record
-        if scene_id==self.scene_id and ti==self.cur_ti:
+        if scene_id==self.session.scene_id and ti==self.session.cur_ti:
             return
-        self.scene_id = scene_id
-        self.cur_ti = ti
-        
-        my_scene = self.nusc.scene[self.scene_id]
-        location = self.nusc.get("log", my_scene["log_token"])["location"]
-        self.nusc_map = self.nusc_map_d[location]
-        self.curr_token = my_scene["first_sample_token"]
-        the_token = self.curr_token
-        ego_traj = []
-        while the_token != "":
-            the_sample = self.nusc.get("sample", the_token)
-            the_lidar_data = self.nusc.get("sample_data", the_sample['data']["LIDAR_TOP"])
-            the_xy = self.nusc.get("ego_pose", the_lidar_data["ego_pose_token"])["translation"]
-            ego_traj.append(the_xy)
-            the_token = the_sample["next"]
-        self.ego_traj=np.array(ego_traj)
+        self.lane_index = None
+        self.hover_lane = None
+        self.canvas_widget.setHoverLine(None, None)
+
+        # the session loads the trajectory and the annotation and takes the scene lease
+        released = [token for token in self.store.held if token != self.session.nusc.scene[scene_id]["first_sample_token"]]
+        lease_owner = self.session.open_scene(scene_id)
+        self.lease_renew_t = time.time()
+        for token in released:
+            self.refresh_record_row(token)
+        self.refresh_record_row(self.session.token)
+        if lease_owner is not None:
+            self.textedit_stats.setText("Scene is being annotated by %s (read-only)"%(lease_owner))
+        self.update_read_only()
+        self.scene_boxes = load_scene_boxes(self.session.nusc, self.session.token, args.nuscenes_cache_dir)
+        self.camera_panel.set_scene(get_scene_camera_paths(self.session.nusc, self.session.token))
         
         # responding to the variables
         self.slider_ego_state.setValue(0)
-        self.slider_ego_state.setRange(0, self.ego_traj.shape[0]-1)
+        self.slider_ego_state.setRange(0, self.session.num_steps()-1)
         self.slider_ego_state.setTickPosition(QSlider.TicksBelow)
-        self.slider_ego_state.setTickInterval(1)
-
-        if self.curr_token in self.cache:
-            self.qimage_cache = self.cache[self.curr_token]["qimage_cache"]
-            self.qimage_legend_cache = self.cache[self.curr_token]["qimage_legend_cache"]
-            self.my_tf = self.cache[self.curr_token]["my_tf"]
-            self.canvas_widget.setPhoto(QPixmap(self.qimage_cache)) 
-            self.label_legend.setPixmap(QPixmap(self.qimage_legend_cache).scaledToWidth(self.width0))
-        else:                        
-            # plot the bird-eye-view scenes
+        # roughly one tick per keyframe on a dense timeline
+        self.slider_ego_state.setTickInterval(max(1, round(self.session.num_steps() / max(len(self.session.sample_tokens), 1))))
+
+        if "qimage_cache" in self.cache.get(self.session.token, {}):
+            self.render_lru.move_to_end(self.session.token)
+        else:
+            # plot the bird-eye-view scenes and the labels on the right;
             # get img outer coordinates in ego/world-frame
-            fig, handles, labels, xmin, xmax, ymin, ymax = visualize_nuscenes_scene(self.nusc_map, self.ego_traj)
-            canvas = FigureCanvas(fig)
-            canvas.draw()
-            self.qimage_cache = QImage(canvas.buffer_rgba(), canvas.size().width(), canvas.size().height(), QImage.Format_ARGB32)
-            pixmap = QPixmap(self.qimage_cache)
-            self.canvas_widget.setPhoto(pixmap)
-            self.my_tf = MyTF(xmin, xmax, ymin, ymax, pixmap.width(), pixmap.height())
-            
-            # plot the labels on the right
-            fig = visualize_nuscenes_legends(handles, labels)
-            canvas = FigureCanvas(fig)
-            canvas.draw()
-            im_legend = QImage(canvas.buffer_rgba(), canvas.size().width(), canvas.size().height(), QImage.Format_ARGB32)
-            self.qimage_legend_cache = remove_qimage_margin(im_legend)
-            pixmap = QPixmap(self.qimage_legend_cache).scaledToWidth(self.width0)
-            self.label_legend.setPixmap(pixmap)
-            self.cache[self.curr_token] = {
-                "qimage_cache": self.qimage_cache, 
-                "my_tf": self.my_tf,
-                "qimage_legend_cache": self.qimage_legend_cache
-            }   
+            qimage, qimage_legend, my_tf = render_nuscenes_scene(self.session.nusc_map, self.session.ego_traj)
+            self.cache[self.session.token] = {
+                "qimage_cache": qimage,
+                "my_tf": my_tf,
+                "qimage_legend_cache": qimage_legend
+            }
+            self.render_lru[self.session.token] = True
+            self.evict_renders()
+        self.qimage_cache = self.cache[self.session.token]["qimage_cache"]
+        self.qimage_legend_cache = self.cache[self.session.token]["qimage_legend_cache"]
+        self.my_tf = self.cache[self.session.token]["my_tf"]
+        self.canvas_widget.setPhoto(QPixmap(self.qimage_cache))
+        self.label_legend.setPixmap(QPixmap(self.qimage_legend_cache).scaledToWidth(self.width0))
         self.slider_ego_state_value_changed()
-        self.reset_data()
-
-    def reset_data(self):
-        assert self.cur_ti==0 and self.curr_token in self.cache
-        if "annotated_data" in self.cache[self.curr_token]:
-            print("load from cache")
-            self.annotated_data = self.cache[self.curr_token]["annotated_data"]
-        else: # new data
-            annot_data_path = "%s/%s.pickle"%(args.nuscenes_save_dir, self.curr_token)
-            if os.path.exists(annot_data_path):
-                with open(annot_data_path, "rb") as f:
-                    self.annotated_data = pickle.load(f)
+        if self.checkbox_hover.isChecked():
+            self.ensure_lane_index()
+
+    def evict_renders(self):
+        # keep at most render_cache_size rendered scenes; annotations are never evicted
+        while len(self.render_lru) > args.render_cache_size:
+            token, _ = self.render_lru.popitem(last=False)
+            for key in ["qimage_cache", "qimage_legend_cache", "my_tf"]:
+                self.cache[token].pop(key, None)
+            self.session.lane_indices.pop(token, None)
+
+    def on_store_timer(self):
+        # follow the change feed; only the rows touched by new events are refreshed
+        if time.time() - self.lease_renew_t > self.store.lease_ttl / 3:
+            self.store.renew_all()
+            self.lease_renew_t = time.time()
+        tokens = set()
+        for rec in self.store.poll():
+            tokens.add(rec["token"])
+            if rec["event"] == "publish":
+                # someone else published this scene, drop our stale in-memory copy
+                if rec["owner"] != self.store.owner:
+                    self.session.drop_scene(rec["token"])
+                if rec["token"] in self.record_row_d:
+                    self.scene_index.update_from_store(self.record_row_d[rec["token"]], self.store)
+        # leases can also expire silently
+        tokens.update(token for token in list(self.store.leases) if self.store.lease_owner(token) is None)
+        # a read-only scene becomes editable once the other annotator lets go of it
+        if self.session.lease_owner is not None and self.store.lease_owner(self.session.token) is None:
+            if self.session.retry_lease() is None:
+                self.textedit_stats.setText("Scene lease acquired, now editable")
+                tokens.add(self.session.token)
+                self.update_read_only()
+                self.slider_ego_state_value_changed()
+        for token in tokens:
+            self.refresh_record_row(token)
+        if tokens:
+            self.apply_record_filter()
+
+    def update_read_only(self):
+        # scenes leased by another annotator can be viewed but not edited
+        editable = self.session.lease_owner is None
+        for widget in [self.combobox_highlevel, self.button_clear, self.button_clear_all, self.button_delete,
+                       self.button_move_up, self.button_move_down, self.button_undo, self.button_redo,
+                       self.button_save_data]:
+            widget.setEnabled(editable)
+
+    def on_index_timer(self):
+        # index a few saved annotations per tick so the table stays responsive
+        for row_idx in self.index_pending[:16]:
+            self.scene_index.update_from_store(row_idx, self.store)
+        self.index_pending = self.index_pending[16:]
+        if not self.index_pending:
+            self.index_timer.stop()
+            self.scene_index.save_cache(self.scene_index_path())
+            self.apply_record_filter()
+
+    def scene_index_path(self):
+        return os.path.join(args.nuscenes_cache_dir, "scene_index.json")
+
+    def apply_record_filter(self):
+        if not self.is_loaded:
+            return
+        rows = self.scene_index.query(self.lineedit_filter.text())
+        num_rows = self.model_records.rowCount()
+        for row_idx in range(num_rows):
+            hidden = rows is not None and row_idx not in rows
+            if hidden != self.tableview_records.isRowHidden(row_idx):
+                self.tableview_records.setRowHidden(row_idx, hidden)
+        if rows is None:
+            self.record_label.setText("Record Tokens")
+        else:
+            self.record_label.setText("Record Tokens (%d/%d)"%(len(rows), num_rows))
+
+    def refresh_record_row(self, token):
+        if token not in self.record_row_d:
+            return
+        row_idx = self.record_row_d[token]
+        status = self.store.status(token)
+        self.scene_index.set_status(row_idx, self.store.is_done(token), status == "in-progress")
+        self.bold_row(row_idx, bold=self.store.is_done(token))
+        model = self.tableview_records.model()
+        for col in range(model.columnCount()):
+            item = model.item(row_idx, col)
+            if status == "in-progress":
+                owner = self.store.lease_owner(token)
+                item.setForeground(QBrush(QColor(0, 128, 0) if owner == self.store.owner else QColor(200, 100, 0)))
+                item.setToolTip("In progress: %s"%(owner))
             else:
-                print("create new")
-                self.annotated_data = {0:{"high_level": None, "lanes":{"curr":[], "left":[], "right":[]}}}
-            self.cache[self.curr_token]["annotated_data"] = self.annotated_data
+                item.setForeground(QBrush())
+                item.setToolTip("Done" if status == "done" else "")
 
-    def bold_row(self, row_idx):
+    def bold_row(self, row_idx, bold=True):
         model = self.tableview_records.model()
         item = model.item(row_idx, 0)
         font = item.font()
-        font.setBold(True)
+        font.setBold(bold)
         item.setFont(font)
 
     def on_tableview_record_clicked(self):
@@ -740,14 +992,55 @@ class MyGUIApp:
             # Get the current index (selected cell) in the table view
             current_index = selection_model.currentIndex()
             # Extract the row ID from the model data
-            scene_id = current_index.row()
-            token = self.model_records.item(current_index.row(), 0).text()
-            self.textedit_stats.setText("Selected scene_id:%s token:%s"%(scene_id, token))
-            self.radio_button1.setChecked(True)
-            self.current_label_key = "curr"
-            self.viz_scene(scene_id=scene_id, ti=0)
-            self.update_scene()
-            self.update_table()
+            self.open_scene(current_index.row())
+
+    def open_scene(self, scene_id):
+        token = self.model_records.item(scene_id, 0).text()
+        self.textedit_stats.setText("Selected scene_id:%s token:%s"%(scene_id, token))
+        self.radio_button1.setChecked(True)
+        self.current_label_key = "curr"
+        self.viz_scene(scene_id=scene_id, ti=0)
+        self.update_scene()
+        self.update_table()
+
+    def on_button_overview_clicked(self):
+        if not self.is_loaded or self.session.token is None:
+            return
+        tt1 = time.time()
+        location = self.session.location
+        def anno_iter():
+            for scene_id, scene in enumerate(self.session.nusc.scene):
+                token = scene["first_sample_token"]
+                if self.session.scene_location(scene_id) != location:
+                    continue
+                # unsaved in-memory edits win over the published file
+                if token in self.session.histories or self.store.is_done(token):
+                    data = self.session.get_annotation(token)
+                    if data is not None:
+                        yield token, data
+        layer = collect_annotated_lanes(anno_iter())
+        if location not in self.map_lane_layers:
+            self.map_lane_layers[location] = collect_map_lanes(self.session.nusc_map_d[location], self.lane_cache)
+        print("Overview data took %.3f seconds"%(time.time()-tt1))
+        self.overview_widget = OverviewWidget(layer, self.lane_cache, background=self.map_lane_layers[location],
+                                              title="Overview: %s (%d annotated lanes)"%(location, len(layer.points)))
+        self.overview_widget.sceneRequested.connect(self.on_overview_scene_requested)
+        self.overview_widget.show()
+
+    def on_overview_scene_requested(self, token):
+        if token in self.record_row_d:
+            row_idx = self.record_row_d[token]
+            self.tableview_records.selectRow(row_idx)
+            self.tableview_records.scrollTo(self.model_records.index(row_idx, 0))
+            self.hover_x = None
+            self.hover_y = None
+            self.plot_lanes = None
+            self.highlighted_lane = None
+            self.model_lane_tokens.clear()
+            self.highlighted_tracked_lane = None
+            self.highlighted_tracked_lane_at = 0
+            self.open_scene(row_idx)
+            self.window.activateWindow()
             
     def on_tableview_lane_tokens_clicked(self):
         selection_model = self.tableview_lane_tokens.selectionModel()
@@ -765,8 +1058,7 @@ class MyGUIApp:
         if selected_items:
             assert len(selected_items)==1
             for item in selected_items:
-                key_list = ["curr", "left", "right"]
-                tracked_lanes_key = self.get_proper_frame()["lanes"][key_list[item.column()]]
+                tracked_lanes_key = self.get_proper_frame()["lanes"][LANE_KEYS[item.column()]]
                 self.highlighted_tracked_lane = tracked_lanes_key[item.row()]
                 lane_token = self.tableview_tracked.item(item.row(), item.column()).text()
                 assert self.highlighted_tracked_lane[1]==lane_token
@@ -774,8 +1066,8 @@ class MyGUIApp:
         self.update_scene()
 
     def on_button_load_annotation_clicked(self):
-        if self.is_loaded and self.curr_token is not None:
-            data_path="%s/%s.pickle"%(args.nuscenes_preview_dir, self.curr_token)
+        if self.is_loaded and self.session.token is not None:
+            data_path="%s/%s.pickle"%(args.nuscenes_preview_dir, self.session.token)
             if os.path.exists(data_path):
                 with open(data_path, "rb") as f:
                     annotated_data = pickle.load(f)
@@ -791,9 +1083,23 @@ class MyGUIApp:
 
     def on_button_save_data_clicked(self):
         if self.is_loaded:
-            with open("%s/%s.pickle"%(args.nuscenes_save_dir, self.curr_token), "wb") as f:
-                pickle.dump(self.annotated_data, f)
-            self.bold_row(self.scene_id)
+            owner = self.session.save()
+            if owner is not None:
+                message_box = QMessageBox()
+                message_box.setIcon(QMessageBox.Warning)
+                message_box.setWindowTitle("Warning")
+                message_box.setText("Not saved, scene is being annotated by %s!"%(owner))
+                message_box.setStandardButtons(QMessageBox.Ok)
+                message_box.exec_()
+                return
+            self.refresh_record_row(self.session.token)
+
+    def on_app_quit(self):
+        self.store_timer.stop()
+        if self.is_loaded:
+            self.scene_index.save_cache(self.scene_index_path())
+        self.store.release_all()
+        self.camera_panel.shutdown()
 
 
 if __name__ == "__main__":
@@ -801,6 +1107,12 @@ if __name__ == "__main__":
     parser.add_argument("--nuscenes_data_dir", type=str, default="../../dataset")
     parser.add_argument("--nuscenes_preview_dir", type=str, default="./preview_data")
     parser.add_argument("--nuscenes_save_dir", type=str, default="./saved_data")
+    parser.add_argument("--render_cache_size", type=int, default=32, help="number of rendered scenes kept in memory")
+    parser.add_argument("--lidar_budget", type=int, default=20000, help="max lidar points drawn per timestep")
+    parser.add_argument("--nuscenes_cache_dir", type=str, default="./cache_data", help="precomputed per-scene data (agent boxes, ...)")
+    parser.add_argument("--ego_rate", type=float, default=0, help="ego timeline rate in Hz from LIDAR_TOP sweeps; 0: keyframes only (2Hz), -1: every sweep")
+    parser.add_argument("--lease_ttl", type=float, default=60.0, help="seconds a scene lease stays valid without renewal")
+    parser.add_argument("--store_poll_ms", type=int, default=1000, help="change feed polling interval")
     args = parser.parse_args()
     my_gui_app = MyGUIApp()
     my_gui_app.window.show()
@@ -0,0 +1,133 @@
+import numpy as np
+
+# Lane geometry helpers without any Qt dependency, shared by the GUI and the
+# headless tools (annotation session, exporters).
+
+def simplify_polyline(points, tol):
+    # Douglas-Peucker on (N, 2+) points, returns the kept rows
+    n = points.shape[0]
+    if n <= 2 or tol <= 0:
+        return points
+    xy = points[:, :2]
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i0, i1 = stack.pop()
+        if i1 - i0 < 2:
+            continue
+        seg = xy[i1] - xy[i0]
+        seg_len = np.linalg.norm(seg)
+        rel = xy[i0 + 1:i1] - xy[i0]
+        if seg_len < 1e-9:
+            dists = np.linalg.norm(rel, axis=1)
+        else:
+            dists = np.abs(seg[0] * rel[:, 1] - seg[1] * rel[:, 0]) / seg_len
+        k = np.argmax(dists)
+        if dists[k] > tol:
+            k = i0 + 1 + k
+            keep[k] = True
+            stack.append((i0, k))
+            stack.append((k, i1))
+    return points[keep]
+
+class LaneGeomCache:
+    # per-lane-token geometry: the dense discretized polyline (hit testing, saved
+    # annotations) and lazily simplified level-of-detail copies for drawing.
+    # Lane tokens are unique across maps, so the token alone is the key.
+    def __init__(self, resolution=0.5, lod_tolerances=(0.05, 0.1, 0.2, 0.4, 0.8, 1.6)):
+        self.resolution = resolution
+        self.lod_tolerances = lod_tolerances
+        self.dense = {}
+        self.lods = {}
+
+    def get_dense(self, nusc_map, lane_tokens):
+        missing = [token for token in lane_tokens if token not in self.dense]
+        if len(missing) > 0:
+            for token, points in nusc_map.discretize_lanes(missing, self.resolution).items():
+                self.dense[token] = np.array(points)
+        return {token: self.dense[token] for token in lane_tokens}
+
+    def lod_level(self, tol):
+        # coarsest level whose tolerance (meters) does not exceed tol, -1 for the dense polyline
+        return int(np.searchsorted(self.lod_tolerances, tol, side="right")) - 1
+
+    def get_lod(self, token, points, tol):
+        level = self.lod_level(tol)
+        if level < 0:
+            return points
+        if token not in self.lods:
+            self.lods[token] = [None] * len(self.lod_tolerances)
+        lods = self.lods[token]
+        if lods[level] is None:
+            lods[level] = simplify_polyline(points, self.lod_tolerances[level])
+        return lods[level]
+
+def lod_tolerance(my_tf, view_scale, screen_px=0.5):
+    # world-space error (meters) that maps to screen_px on screen at the current zoom
+    return screen_px * my_tf.ratio / max(view_scale, 1e-6)
+
+class LaneIndex:
+    # uniform grid over all discretized lane points of a scene, for fast
+    # nearest-lane queries (hover, one-click labeling)
+    def __init__(self, lanes, cell=4.0):
+        # lanes: dict of token -> dense points
+        self.cell = cell
+        self.tokens = list(lanes.keys())
+        self.lane_points = [lanes[token] for token in self.tokens]
+        if len(self.tokens) == 0:
+            self.points = np.zeros((0, 2))
+            self.owner = np.zeros((0,), dtype=np.int64)
+        else:
+            self.points = np.concatenate([points[:, :2] for points in self.lane_points], axis=0)
+            self.owner = np.concatenate([np.full(points.shape[0], i) for i, points in enumerate(self.lane_points)])
+        keys = self.cell_keys(np.floor(self.points / cell).astype(np.int64))
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.points = self.points[order]
+        self.owner = self.owner[order]
+
+    @staticmethod
+    def cell_keys(cells):
+        return cells[..., 0] * 1000003 + cells[..., 1]
+
+    def query(self, x, y, max_dist=4.0):
+        # returns (dist, token, dense points) of the nearest lane, or None
+        if self.points.shape[0] == 0:
+            return None
+        ring = int(np.ceil(max_dist / self.cell))
+        cx, cy = int(np.floor(x / self.cell)), int(np.floor(y / self.cell))
+        dx, dy = np.meshgrid(np.arange(-ring, ring + 1), np.arange(-ring, ring + 1))
+        keys = self.cell_keys(np.stack([cx + dx.ravel(), cy + dy.ravel()], axis=-1))
+        lo = np.searchsorted(self.keys, keys, side="left")
+        hi = np.searchsorted(self.keys, keys, side="right")
+        idx = np.concatenate([np.arange(l, h) for l, h in zip(lo, hi) if h > l] or [np.zeros((0,), dtype=np.int64)])
+        if idx.shape[0] == 0:
+            return None
+        d = np.linalg.norm(self.points[idx] - [x, y], axis=1)
+        k = np.argmin(d)
+        if d[k] > max_dist:
+            return None
+        lane_i = self.owner[idx[k]]
+        return (d[k], self.tokens[lane_i], self.lane_points[lane_i])
+
+def build_lane_index(nusc_map, lane_cache, patch):
+    # patch: (x_min, y_min, x_max, y_max) in world frame
+    lanes = nusc_map.get_records_in_patch(patch, ['lane', 'lane_connector'], mode='intersect')
+    lanes = lanes['lane'] + lanes['lane_connector']
+    return LaneIndex(lane_cache.get_dense(nusc_map, lanes))
+
+def get_lanes_nearby(nusc_map, x, y, radius, lane_cache=None):
+    lanes = nusc_map.get_records_in_radius(x, y, radius, ['lane', 'lane_connector'])
+    lanes = lanes['lane'] + lanes['lane_connector']
+    if lane_cache is not None:
+        discrete_points = lane_cache.get_dense(nusc_map, lanes)
+    else:
+        discrete_points = {lane_id: np.array(points) for lane_id, points in nusc_map.discretize_lanes(lanes, 0.5).items()}
+    rec_list=[]
+    for lane_id, points in discrete_points.items():
+        d = np.linalg.norm(points[:, :2] - [x, y], axis=1).min()
+        rec_list.append((d, lane_id, points))
+    if len(rec_list)>1:
+        rec_list = sorted(rec_list, key=lambda x:x[0])
+    return rec_list
@@ -0,0 +1,19 @@
+import os
+import numpy as np
+
+# Per-scene arrays cached on disk as .npz (agent boxes, ego sweeps). The file is
+# written under a temp name and os.replace()d, so concurrent instances sharing the
+# cache dir never read a half-written file.
+
+
+def load_npz_cached(cache_path, build):
+    # dict of arrays from cache_path, or build() it and save it there
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            return {k: data[k] for k in data.files}
+    arrays = build()
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path[:-len(".npz")] + ".%d.tmp.npz" % (os.getpid())
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, cache_path)
+    return arrays
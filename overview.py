@@ -0,0 +1,229 @@
+import time
+import numpy as np
+from PyQt5.QtCore import Qt, QPoint, QTimer, pyqtSignal
+from PyQt5.QtGui import QPainter, QPen, QColor, QPixmap, QTransform
+from PyQt5.QtWidgets import QWidget
+
+from utils import LaneIndex, to_qpolygonf
+from anno_history import LANE_KEYS
+
+# Location overview: every annotated lane of every saved scene of one map on a
+# single pannable/zoomable view. Only lanes whose bounding box intersects the
+# viewport (and spans at least a pixel) are drawn, each at the level of detail
+# matching the zoom. Polylines are kept in world coordinates as cached QPolygonF
+# and the painter transform maps them to the screen. A render is cached as a pixmap;
+# while dragging, the pixmap is only shifted and the view is re-rendered once the
+# drag ends or pauses.
+
+
+class OverviewLayer:
+    def __init__(self):
+        self.points = []
+        self.tokens = []
+        self.key_ids = []
+        self.scene_tokens = []
+        self.bboxes = np.zeros((0, 4))
+        self.lane_index = None
+
+    def add(self, points, token, key_i, scene_token):
+        self.points.append(points)
+        self.tokens.append(token)
+        self.key_ids.append(key_i)
+        self.scene_tokens.append(scene_token)
+
+    def finalize(self):
+        if len(self.points) > 0:
+            self.bboxes = np.array([[p[:, 0].min(), p[:, 1].min(), p[:, 0].max(), p[:, 1].max()] for p in self.points])
+        self.key_ids = np.array(self.key_ids, dtype=np.int64)
+        return self
+
+    def extent(self):
+        if self.bboxes.shape[0] == 0:
+            return None
+        return self.bboxes[:, 0].min(), self.bboxes[:, 1].min(), self.bboxes[:, 2].max(), self.bboxes[:, 3].max()
+
+    def visible(self, x_min, y_min, x_max, y_max, min_size=0.0):
+        # indices of the entries intersecting the rect and not smaller than min_size
+        b = self.bboxes
+        mask = (b[:, 2] >= x_min) & (b[:, 0] <= x_max) & (b[:, 3] >= y_min) & (b[:, 1] <= y_max)
+        if min_size > 0:
+            mask &= np.maximum(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]) >= min_size
+        return np.nonzero(mask)[0]
+
+    def query(self, x, y, max_dist):
+        # entry index of the nearest lane, or None
+        if self.lane_index is None:
+            self.lane_index = LaneIndex({i: points for i, points in enumerate(self.points)}, cell=8.0)
+        hit = self.lane_index.query(x, y, max_dist=max_dist)
+        return None if hit is None else hit[1]
+
+
+def collect_annotated_lanes(anno_iter):
+    # anno_iter yields (scene_token, annotated_data); each lane is kept once per scene and key
+    layer = OverviewLayer()
+    for scene_token, data in anno_iter:
+        seen = set()
+        for frame in data.values():
+            for key_i, key in enumerate(LANE_KEYS):
+                for lane in frame["lanes"][key]:
+                    if (key_i, lane[1]) not in seen:
+                        seen.add((key_i, lane[1]))
+                        layer.add(np.asarray(lane[-1])[:, :2], lane[1], key_i, scene_token)
+    return layer.finalize()
+
+
+def collect_map_lanes(nusc_map, lane_cache):
+    layer = OverviewLayer()
+    tokens = [rec["token"] for rec in nusc_map.lane + nusc_map.lane_connector]
+    for token, points in lane_cache.get_dense(nusc_map, tokens).items():
+        layer.add(points[:, :2], token, -1, None)
+    return layer.finalize()
+
+
+class OverviewWidget(QWidget):
+    sceneRequested = pyqtSignal(str)
+
+    def __init__(self, layer, lane_cache, background=None, title="Overview"):
+        super().__init__()
+        self.layer = layer
+        self.background = background
+        self.lane_cache = lane_cache
+        self.polygons = {}  # (token, lod level) -> world-frame QPolygonF
+        self.key_pens = [QPen(QColor(0, 200, 200, 200), 3), QPen(QColor(220, 0, 220, 200), 3), QPen(QColor(220, 200, 0, 200), 3)]
+        self.background_pen = QPen(QColor(90, 90, 90, 255), 1)
+        for pen in self.key_pens + [self.background_pen]:
+            pen.setCosmetic(True)  # width in screen pixels whatever the zoom
+            pen.setCapStyle(Qt.RoundCap)
+        self.setWindowTitle(title)
+        self.resize(900, 900)
+        self.setMouseTracking(False)
+        self.scale = 1.0  # pixels per meter
+        self.center = (0.0, 0.0)
+        self.drag_pos = None
+        self.cache_pixmap = None
+        self.pan_offset = QPoint(0, 0)  # drag since the cached render, in pixels
+        self.pan_timer = QTimer(self)
+        self.pan_timer.setSingleShot(True)
+        self.pan_timer.setInterval(150)
+        self.pan_timer.timeout.connect(self.invalidate)
+        self.stats = ""
+        self.fit_view()
+
+    def fit_view(self):
+        extent = self.layer.extent()
+        if extent is None and self.background is not None:
+            extent = self.background.extent()
+        if extent is None:
+            return
+        x_min, y_min, x_max, y_max = extent
+        self.center = ((x_min + x_max) / 2, (y_min + y_max) / 2)
+        self.scale = 0.9 * min(self.width() / max(x_max - x_min, 1.0), self.height() / max(y_max - y_min, 1.0))
+        self.invalidate()
+
+    def invalidate(self):
+        self.pan_timer.stop()
+        self.cache_pixmap = None
+        self.pan_offset = QPoint(0, 0)
+        self.update()
+
+    def world_transform(self):
+        # world (y up) -> widget pixels (y down)
+        tx = self.width() / 2 - self.center[0] * self.scale
+        ty = self.height() / 2 + self.center[1] * self.scale
+        return QTransform(self.scale, 0, 0, -self.scale, tx, ty)
+
+    def pixel_to_world(self, x_pixel, y_pixel):
+        x_world = (x_pixel - self.width() / 2) / self.scale + self.center[0]
+        y_world = -(y_pixel - self.height() / 2) / self.scale + self.center[1]
+        return x_world, y_world
+
+    def get_polygon(self, layer, i, tol):
+        token = layer.tokens[i]
+        key = (token, self.lane_cache.lod_level(tol))
+        polygon = self.polygons.get(key)
+        if polygon is None:
+            points = self.lane_cache.get_lod(token, layer.points[i], tol)
+            polygon = to_qpolygonf(points[:, 0], points[:, 1])
+            self.polygons[key] = polygon
+        return polygon
+
+    def draw_layer(self, painter, layer, pens, tol, rect):
+        # culled to the viewport; lanes smaller than a pixel are skipped
+        indices = layer.visible(*rect, min_size=1.0 / self.scale)
+        indices = indices[np.argsort(layer.key_ids[indices], kind="stable")]
+        pen_key = None
+        for i in indices:
+            if layer.key_ids[i] != pen_key:
+                pen_key = layer.key_ids[i]
+                painter.setPen(pens[pen_key] if pen_key >= 0 else self.background_pen)
+            painter.drawPolyline(self.get_polygon(layer, i, tol))
+        return len(indices)
+
+    def render(self):
+        tt1 = time.time()
+        pixmap = QPixmap(self.size())
+        pixmap.fill(QColor(30, 30, 30))
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setTransform(self.world_transform())
+        x0, y1 = self.pixel_to_world(0, 0)
+        x1, y0 = self.pixel_to_world(self.width(), self.height())
+        tol = 0.5 / self.scale
+        n_drawn = 0
+        if self.background is not None:
+            n_drawn += self.draw_layer(painter, self.background, None, tol, (x0, y0, x1, y1))
+        n_drawn += self.draw_layer(painter, self.layer, self.key_pens, tol, (x0, y0, x1, y1))
+        painter.end()
+        self.stats = "%d/%d lanes drawn in %.1fms  (%.2f px/m)" % (
+            n_drawn, len(self.layer.points) + (len(self.background.points) if self.background is not None else 0),
+            (time.time() - tt1) * 1000, self.scale)
+        return pixmap
+
+    def paintEvent(self, event):
+        if self.cache_pixmap is None or self.cache_pixmap.size() != self.size():
+            self.cache_pixmap = self.render()
+        painter = QPainter(self)
+        if not self.pan_offset.isNull():
+            painter.fillRect(self.rect(), QColor(30, 30, 30))
+        painter.drawPixmap(self.pan_offset, self.cache_pixmap)
+        painter.setPen(QColor(220, 220, 220))
+        painter.drawText(8, self.height() - 8, self.stats)
+        painter.end()
+
+    def resizeEvent(self, event):
+        self.invalidate()
+        super().resizeEvent(event)
+
+    def wheelEvent(self, event):
+        # zoom around the cursor
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        x_world, y_world = self.pixel_to_world(event.pos().x(), event.pos().y())
+        self.scale *= factor
+        x_new, y_new = self.pixel_to_world(event.pos().x(), event.pos().y())
+        self.center = (self.center[0] + x_world - x_new, self.center[1] + y_world - y_new)
+        self.invalidate()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.drag_pos = event.pos()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_pos is not None:
+            delta = event.pos() - self.drag_pos
+            self.drag_pos = event.pos()
+            self.center = (self.center[0] - delta.x() / self.scale, self.center[1] + delta.y() / self.scale)
+            # shift the last render, re-render once the drag pauses
+            self.pan_offset += delta
+            self.pan_timer.start()
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        self.drag_pos = None
+        if not self.pan_offset.isNull():
+            self.invalidate()
+
+    def mouseDoubleClickEvent(self, event):
+        x_world, y_world = self.pixel_to_world(event.pos().x(), event.pos().y())
+        entry_i = self.layer.query(x_world, y_world, max_dist=max(8.0 / self.scale, 1.0))
+        if entry_i is not None:
+            self.sceneRequested.emit(self.layer.scene_tokens[entry_i])
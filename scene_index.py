@@ -0,0 +1,172 @@
+import os
+import json
+from collections import defaultdict
+
+from anno_history import LANE_KEYS
+
+# Inverted index over the scenes, behind the record table filter. A scene (one row
+# of the table) is a set of (field, value) terms and every term maps to the rows
+# having it, so a query is a handful of set operations whatever the dataset size.
+#   loc, log, token   scene metadata, added once when the dataset is loaded
+#   status            done or unlabeled, plus in-progress while leased, following the store
+#   hl, kf, lane      high-level labels, keyframe count and lane tokens of the
+#                     saved annotation, replaced whenever its file changes
+# The annotation terms are cached per token with the file mtime, so a restart only
+# reloads the annotations saved since.
+
+FIELDS = ["loc", "log", "token", "status", "hl", "kf", "lane"]
+ANNO_FIELDS = ["hl", "kf", "lane"]
+FIELD_ALIASES = {"location": "loc", "high_level": "hl", "highlevel": "hl", "keyframes": "kf", "lanes": "lane"}
+TEXT_FIELDS = ["loc", "hl"]  # human-readable, matched by substring; the others by prefix
+TOKEN_FIELDS = ["log", "token", "lane"]
+MIN_BARE_PREFIX = 4  # a word without field: only reaches the hex tokens from this length on
+
+
+def norm_value(value):
+    return str(value).lower().replace(" ", "-")
+
+
+def annotation_terms(data):
+    terms = {("kf", str(len(data)))}
+    for frame in data.values():
+        terms.add(("hl", norm_value(frame["high_level"])))
+        for key in LANE_KEYS:
+            for lane in frame["lanes"][key]:
+                terms.add(("lane", lane[1]))
+    return terms
+
+
+class SceneIndex:
+    def __init__(self):
+        self.postings = {field: defaultdict(set) for field in FIELDS}  # field -> value -> rows
+        self.row_terms = defaultdict(set)
+        self.tokens = {}  # row -> scene token
+        self.anno_stamp = {}  # row -> mtime of the indexed annotation file
+        self.cached = {}  # token -> (mtime, annotation terms) from a previous run
+
+    def add_term(self, row, field, value):
+        self.postings[field][value].add(row)
+        self.row_terms[row].add((field, value))
+
+    def remove_term(self, row, field, value):
+        rows = self.postings[field].get(value)
+        if rows is not None:
+            rows.discard(row)
+            if not rows:
+                del self.postings[field][value]
+        self.row_terms[row].discard((field, value))
+
+    def remove_fields(self, row, fields):
+        for field, value in [term for term in self.row_terms[row] if term[0] in fields]:
+            self.remove_term(row, field, value)
+
+    # ---------- updates ----------
+    def add_scene(self, row, token, log_token, location):
+        self.tokens[row] = token
+        self.add_term(row, "token", token)
+        self.add_term(row, "log", log_token)
+        self.add_term(row, "loc", norm_value(location))
+        self.add_term(row, "status", "unlabeled")
+
+    def set_status(self, row, done, in_progress):
+        # a saved scene that is being edited again is both done and in-progress
+        self.remove_fields(row, ["status"])
+        self.add_term(row, "status", "done" if done else "unlabeled")
+        if in_progress:
+            self.add_term(row, "status", "in-progress")
+
+    def set_annotation_terms(self, row, terms, stamp=None):
+        self.remove_fields(row, ANNO_FIELDS)
+        for field, value in terms:
+            self.add_term(row, field, value)
+        self.anno_stamp[row] = stamp
+
+    def update_from_store(self, row, store):
+        # reindex the saved annotation of a scene if its file changed; True if it did
+        token = self.tokens[row]
+        try:
+            stamp = os.stat(store.anno_path(token)).st_mtime
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self.anno_stamp.get(row):
+            return False
+        cached = self.cached.get(token)
+        if stamp is None:
+            terms = set()
+        elif cached is not None and cached[0] == stamp:
+            terms = cached[1]
+        else:
+            data = store.load(token)
+            terms = annotation_terms(data) if data is not None else set()
+        self.set_annotation_terms(row, terms, stamp)
+        return True
+
+    # ---------- query ----------
+    def match(self, field, value):
+        # rows with a term of field matching value; any field if field is None.
+        # kf also takes comparisons: kf:>3, kf:<2
+        rows = set()
+        for f in ([field] if field is not None else FIELDS):
+            postings = self.postings[f]
+            if field is None and f in TOKEN_FIELDS and len(value) < MIN_BARE_PREFIX:
+                continue
+            if f == "kf" and value[:1] in "<>" and value[1:].isdigit():
+                n = int(value[1:])
+                for v, v_rows in postings.items():
+                    if (int(v) > n) if value[0] == ">" else (int(v) < n):
+                        rows |= v_rows
+            elif value in postings:
+                rows |= postings[value]
+            elif f in TEXT_FIELDS:
+                for v, v_rows in postings.items():
+                    if value in v:
+                        rows |= v_rows
+            elif f != "kf":
+                for v, v_rows in postings.items():
+                    if v.startswith(value):
+                        rows |= v_rows
+        return rows
+
+    def query(self, text):
+        # space-separated words are ANDed; "field:value" restricts a word to one field,
+        # a leading "-" negates it. Returns the matching rows, None for an empty query
+        rows = None
+        for word in text.lower().split():
+            negate = word.startswith("-") and len(word) > 1
+            if negate:
+                word = word[1:]
+            field, value = None, word
+            if ":" in word:
+                field, value = word.split(":", 1)
+                field = FIELD_ALIASES.get(field, field)
+                if field not in self.postings:
+                    field, value = None, word
+            matched = self.match(field, value)
+            if negate:
+                matched = set(self.tokens) - matched
+            rows = matched if rows is None else rows & matched
+        return rows
+
+    # ---------- cache ----------
+    def load_cache(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except ValueError:
+            return
+        self.cached = {token: (stamp, set(tuple(term) for term in terms)) for token, (stamp, terms) in cache.items()}
+
+    def save_cache(self, path):
+        # entries of scenes not reindexed yet are carried over
+        cache = {token: (stamp, sorted(terms)) for token, (stamp, terms) in self.cached.items()}
+        for row, stamp in self.anno_stamp.items():
+            if stamp is None:
+                cache.pop(self.tokens[row], None)
+            else:
+                cache[self.tokens[row]] = (stamp, sorted(term for term in self.row_terms[row] if term[0] in ANNO_FIELDS))
+        tmp_path = path + ".%d.tmp" % (os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
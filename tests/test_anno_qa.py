@@ -0,0 +1,60 @@
+import os
+import sys
+import pickle
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from anno_qa import check_file, check_annotation, run_qa
+
+
+def write_pickle(tmp_path, name, data):
+    path = os.path.join(str(tmp_path), "%s.pickle" % name)
+    with open(path, "wb") as f:
+        pickle.dump(data, f)
+    return path
+
+
+def test_malformed_keyframe_is_reported(tmp_path):
+    data = {0: {"high_level": "Lane-keeping", "lanes": None}}
+    result = check_file((write_pickle(tmp_path, "bad", data), "save", None, 1.0))
+    assert result["token"] == "bad"
+    assert [issue[0] for issue in result["issues"]] == ["bad_format"]
+
+
+def test_non_tuple_lane_is_reported(tmp_path):
+    data = {0: {"high_level": "Lane-keeping", "lanes": {"curr": [3, 4], "left": [], "right": []}}}
+    result = check_file((write_pickle(tmp_path, "bad_lane", data), "save", None, 1.0))
+    assert [issue[0] for issue in result["issues"]] == ["bad_format"]
+
+
+def test_valid_annotation(tmp_path):
+    points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    data = {0: {"high_level": "Lane-keeping", "lanes": {"curr": [(0.0, "lane-a", points)], "left": [], "right": []}}}
+    result = check_file((write_pickle(tmp_path, "good", data), "save", None, 1.0))
+    assert result["issues"] == [] and result["n_keyframes"] == 1
+
+
+def test_lane_graph_check():
+    points_a = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    points_b = np.array([[1.0, 0.0, 0.0], [2.0, 0.0, 0.0]])
+    data = {0: {"high_level": "Lane-keeping", "lanes": {"curr": [(0.0, "lane-a", points_a), (0.0, "lane-b", points_b)],
+                                                      "left": [], "right": []}}}
+    assert check_annotation(data, outgoing={"lane-a": ["lane-b"]}) == []
+    assert [issue[0] for issue in check_annotation(data, outgoing={"lane-a": []})] == ["not_in_lane_graph"]
+
+
+def test_run_qa(tmp_path):
+    save_dir = tmp_path / "save"
+    save_dir.mkdir()
+    points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    write_pickle(save_dir, "good", {0: {"high_level": "Lane-keeping",
+                                        "lanes": {"curr": [(0.0, "lane-a", points)], "left": [], "right": []}}})
+    write_pickle(save_dir, "bad", {0: {"high_level": None, "lanes": None}})
+    scene_meta = {"good": ("boston-seaport", 40), "bad": ("boston-seaport", 40), "todo": ("singapore-onenorth", 40)}
+    summary, results = run_qa([("save", str(save_dir)), ("preview", str(tmp_path / "missing"))], scene_meta,
+                              data_dir=None, num_workers=2)
+    assert summary["n_files"] == 2 and summary["n_clean"] == 1
+    assert summary["scenes_with_issue"] == {"bad_format": 1}
+    assert summary["coverage"]["boston-seaport"] == {"n_scenes": 2, "n_annotated": 2}
+    assert summary["coverage"]["singapore-onenorth"] == {"n_scenes": 1, "n_annotated": 0}
+    assert sorted(res["source"] for res in results) == ["save", "save"]
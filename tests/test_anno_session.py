@@ -0,0 +1,40 @@
+import os
+import sys
+import pickle
+import pytest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from anno_session import AnnotationSession
+from anno_store import AnnoStore
+
+
+def make_session(store=None):
+    session = AnnotationSession(store)
+    session.open_annotation("scene-a")
+    session.toggle_lane("curr", (0.0, "lane-a", np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])))
+    return session
+
+
+def test_save_without_store_needs_a_path():
+    session = make_session()
+    with pytest.raises(ValueError):
+        session.save()
+
+
+def test_save_without_store_to_path(tmp_path):
+    session = make_session()
+    path = os.path.join(str(tmp_path), "scene-a.pickle")
+    assert session.save(path) is None
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    assert [lane[1] for lane in data[0]["lanes"]["curr"]] == ["lane-a"]
+    assert [fname for fname in os.listdir(str(tmp_path))] == ["scene-a.pickle"]
+
+
+def test_save_publishes_to_store(tmp_path):
+    store = AnnoStore(str(tmp_path), owner="tester")
+    session = make_session(store)
+    assert session.save() is None
+    assert store.is_done("scene-a")
+    assert [lane[1] for lane in store.load("scene-a")[0]["lanes"]["curr"]] == ["lane-a"]
@@ -0,0 +1,23 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from npz_cache import load_npz_cached
+
+
+def test_builds_once_then_reads_the_cache(tmp_path):
+    cache_path = str(tmp_path / "ego" / "scene.npz")
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"timestamp": np.arange(3, dtype=np.int64), "is_key": np.array([True, False, True])}
+
+    first = load_npz_cached(cache_path, build)
+    second = load_npz_cached(cache_path, build)
+    assert len(calls) == 1
+    assert sorted(second) == ["is_key", "timestamp"]
+    np.testing.assert_array_equal(first["timestamp"], second["timestamp"])
+    assert second["is_key"].dtype == bool
+    assert os.listdir(os.path.dirname(cache_path)) == ["scene.npz"]
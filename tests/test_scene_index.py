@@ -0,0 +1,87 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scene_index import SceneIndex, annotation_terms
+
+
+def make_frame(high_level, lane_tokens):
+    return {"high_level": high_level, "lanes": {"curr": [(0.0, token, np.zeros((2, 3))) for token in lane_tokens],
+                                                "left": [], "right": []}}
+
+
+def make_index():
+    # rows: 0 boston done, 1 singapore done and leased, 2 singapore unlabeled, 3 singapore unlabeled and leased
+    index = SceneIndex()
+    index.add_scene(0, "a1b2c3d4", "log00001", "boston-seaport")
+    index.add_scene(1, "a1ffee00", "log00002", "singapore-onenorth")
+    index.add_scene(2, "bead0000", "log00002", "singapore-queenstown")
+    index.add_scene(3, "c0ffee00", "log00003", "singapore-hollandvillage")
+    index.set_status(0, True, False)
+    index.set_status(1, True, True)
+    index.set_status(2, False, False)
+    index.set_status(3, False, True)
+    index.set_annotation_terms(0, annotation_terms({0: make_frame("Lane-keeping", ["lane0001"]),
+                                                    5: make_frame("Left-lane-change", ["lane0002", "lane0003"])}))
+    index.set_annotation_terms(1, annotation_terms({0: make_frame("Stop sign", ["lane0003"])}))
+    return index
+
+
+def test_empty_query():
+    assert make_index().query("  ") is None
+
+
+def test_status_done_and_in_progress_are_independent():
+    index = make_index()
+    assert index.query("status:done") == {0, 1}
+    assert index.query("status:in-progress") == {1, 3}
+    assert index.query("status:unlabeled") == {2, 3}
+    assert index.query("status:done status:in-progress") == {1}
+    index.set_status(1, True, False)
+    assert index.query("status:in-progress") == {3}
+    assert index.query("status:done") == {0, 1}
+
+
+def test_text_fields_match_substrings():
+    index = make_index()
+    assert index.query("singapore") == {1, 2, 3}
+    assert index.query("loc:onenorth") == {1}
+    assert index.query("hl:left") == {0}
+    assert index.query("left-lane-change") == {0}
+    assert index.query("singapore unlabeled") == {2, 3}
+
+
+def test_token_fields_match_prefixes():
+    index = make_index()
+    assert index.query("token:a1") == {0, 1}
+    assert index.query("token:ffee") == set()
+    assert index.query("lane:lane0003") == {0, 1}
+    assert index.query("lane:0003") == set()
+    assert index.query("log:log00002") == {1, 2}
+
+
+def test_bare_words_need_four_characters_for_tokens():
+    index = make_index()
+    assert index.query("a1b") == set()
+    assert index.query("a1b2") == {0}
+    assert index.query("c0ffee") == {3}
+    assert index.query("ffee") == set()
+
+
+def test_negation_and_keyframe_counts():
+    index = make_index()
+    assert index.query("-singapore") == {0}
+    assert index.query("-status:done") == {2, 3}
+    assert index.query("kf:2") == {0}
+    assert index.query("kf:>1") == {0}
+    assert index.query("kf:<2") == {1}
+    assert index.query("status:done -hl:stop") == {0}
+
+
+def test_reindexing_replaces_annotation_terms():
+    index = make_index()
+    index.set_annotation_terms(0, annotation_terms({0: make_frame("Traffic light", ["lane0009"])}))
+    assert index.query("lane:lane0001") == set()
+    assert index.query("hl:traffic") == {0}
+    assert index.query("loc:boston") == {0}
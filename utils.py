@@ -1,13 +1,31 @@
+import os
 import numpy as np
 from PyQt5.QtCore import Qt, QRectF, pyqtSignal, QPointF, QRect
 from PyQt5.QtGui import QIcon,QPainter, QBrush, QColor, QPixmap, QImage, QStandardItemModel,\
-    QStandardItem, QPen
+    QStandardItem, QPen, QPolygonF, QPainterPath
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from lane_geom import simplify_polyline, LaneGeomCache, lod_tolerance, LaneIndex, build_lane_index, get_lanes_nearby
+from npz_cache import load_npz_cached
+
+def close_figure(fig):
+    # figures created through pyplot (e.g. by the devkit) stay registered until closed
+    fig.clf()
+    plt.close(fig)
+
+def fig_to_qimage(fig):
+    # render with a plain Agg canvas (no Qt widget per figure), copy the pixels
+    # so the QImage owns them, then release the figure
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    qimage = QImage(canvas.buffer_rgba(), width, height, width * 4, QImage.Format_RGBA8888).copy()
+    close_figure(fig)
+    return qimage
 
 def fig_to_pixmap(fig):
-    buf, size = fig.canvas.print_to_buffer()
-    qimage = QPixmap.fromImage(buf.tostring(), 'raw', size.width, size.height, 3)
-    return QPixmap(qimage)
+    return QPixmap.fromImage(fig_to_qimage(fig))
 
 def remove_qimage_margin(im):
     def is_all_white(data):
@@ -46,18 +64,6 @@ def remove_qimage_margin(im):
     # Crop the image using the determined coordinates
     return im.copy(left, top, right - left + 1, bottom-top+1)
 
-def get_lanes_nearby(nusc_map, x, y, radius):
-    lanes = nusc_map.get_records_in_radius(x, y, radius, ['lane', 'lane_connector'])
-    lanes = lanes['lane'] + lanes['lane_connector']
-    discrete_points = nusc_map.discretize_lanes(lanes, 0.5)
-    rec_list=[]
-    for lane_id, points in discrete_points.items():
-        d = np.linalg.norm(np.array(points)[:, :2] - [x, y], axis=1).min()
-        rec_list.append((d, lane_id, np.array(points)))
-    if len(rec_list)>1:
-        rec_list = sorted(rec_list, key=lambda x:x[0])
-    return rec_list
-
 def visualize_nuscenes_scene(nusc_map, ego_traj):
     r = 100
     tj_xmin = np.min(ego_traj[:,0])
@@ -71,8 +77,8 @@ def visualize_nuscenes_scene(nusc_map, ego_traj):
     my_patch = (patch_center_x - radius,  patch_center_y-radius, patch_center_x+radius, patch_center_y+radius)
 
     fig, ax = nusc_map.render_map_patch(my_patch, nusc_map.non_geometric_layers, figsize=(12, 12), bitmap=None)
-    plt.plot([xxx[0]for xxx in ego_traj], [xxx[1]for xxx in ego_traj], color="blue", linestyle="--", linewidth=2)
-    plt.axis("scaled")
+    ax.plot([xxx[0]for xxx in ego_traj], [xxx[1]for xxx in ego_traj], color="blue", linestyle="--", linewidth=2)
+    ax.axis("scaled")
     x_min, y_min, x_max, y_max = my_patch
 
     margin = 20
@@ -93,8 +99,9 @@ def visualize_nuscenes_scene(nusc_map, ego_traj):
     return fig, handles, labels, xmin, xmax, ymin, ymax
 
 def visualize_nuscenes_legends(handles, labels):
-    fig = plt.figure(figsize=(2,3))
-    ax2 = plt.gca()
+    # not created through pyplot, so nothing global keeps it alive
+    fig = Figure(figsize=(2,3))
+    ax2 = fig.add_subplot(1, 1, 1)
     legend2 = ax2.legend(handles, labels)
     ax2.add_artist(legend2)
     ax2.set_xticks([])
@@ -108,6 +115,108 @@ def visualize_nuscenes_legends(handles, labels):
     fig.tight_layout()
     return fig
 
+def quaternion_yaw(q):
+    # q: (N, 4) as [w, x, y, z]
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+
+def collect_scene_boxes(nusc, first_sample_token):
+    # all sample_annotation boxes of a scene, sorted by timestep;
+    # boxes of timestep ti are rows offsets[ti]:offsets[ti+1]
+    ti_list, centers, sizes, rotations, category_names = [], [], [], [], []
+    the_token = first_sample_token
+    ti = 0
+    while the_token != "":
+        the_sample = nusc.get("sample", the_token)
+        for ann_token in the_sample["anns"]:
+            ann = nusc.get("sample_annotation", ann_token)
+            ti_list.append(ti)
+            centers.append(ann["translation"])
+            sizes.append(ann["size"])
+            rotations.append(ann["rotation"])
+            category_names.append(ann["category_name"])
+        the_token = the_sample["next"]
+        ti += 1
+    categories = sorted(set(category_names))
+    category_d = {name: i for i, name in enumerate(categories)}
+    ti_arr = np.array(ti_list, dtype=np.int64)
+    return {
+        "center": np.array(centers, dtype=np.float64).reshape(-1, 3),
+        "size": np.array(sizes, dtype=np.float64).reshape(-1, 3),
+        "yaw": quaternion_yaw(np.array(rotations, dtype=np.float64).reshape(-1, 4)),
+        "category": np.array([category_d[name] for name in category_names], dtype=np.int64),
+        "categories": np.array(categories, dtype=str),
+        "offsets": np.searchsorted(ti_arr, np.arange(ti + 1)),
+    }
+
+def load_scene_boxes(nusc, first_sample_token, cache_dir):
+    cache_path = os.path.join(cache_dir, "boxes", "%s.npz"%(first_sample_token))
+    return load_npz_cached(cache_path, lambda: collect_scene_boxes(nusc, first_sample_token))
+
+def quaternion_to_matrix(q):
+    # q: [w, x, y, z] -> 3x3 rotation matrix
+    w, x, y, z = q
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]])
+
+def voxel_decimate(points, voxel, budget):
+    # keep one point per xy voxel, then thin uniformly down to the point budget
+    if points.shape[0] == 0:
+        return points
+    cells = np.floor(points[:, :2] / voxel).astype(np.int64)
+    cells -= cells.min(axis=0)
+    keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    _, first = np.unique(keys, return_index=True)
+    points = points[np.sort(first)]
+    if points.shape[0] > budget:
+        points = points[np.linspace(0, points.shape[0] - 1, budget).astype(np.int64)]
+    return points
+
+def load_lidar_bev(nusc, sample_token, budget=20000, voxel=0.25, min_range=2.0):
+    # LIDAR_TOP sweep of a sample in world frame, (N, 3) float32, decimated to the budget
+    the_sample = nusc.get("sample", sample_token)
+    sd = nusc.get("sample_data", the_sample["data"]["LIDAR_TOP"])
+    cs = nusc.get("calibrated_sensor", sd["calibrated_sensor_token"])
+    pose = nusc.get("ego_pose", sd["ego_pose_token"])
+    # .pcd.bin is float32 x, y, z, intensity, ring; memmap avoids reading it all up front
+    raw = np.memmap(os.path.join(nusc.dataroot, sd["filename"]), dtype=np.float32, mode="r")
+    xyz = np.asarray(raw.reshape(-1, 5)[:, :3])
+    xyz = xyz[np.einsum("ij,ij->i", xyz[:, :2], xyz[:, :2]) > min_range * min_range]  # drop ego body returns
+    # sensor -> ego -> world in a single affine pass
+    rot = quaternion_to_matrix(pose["rotation"]) @ quaternion_to_matrix(cs["rotation"])
+    trans = quaternion_to_matrix(pose["rotation"]) @ np.array(cs["translation"]) + np.array(pose["translation"])
+    xyz = xyz @ rot.T.astype(np.float32) + trans.astype(np.float32)
+    return voxel_decimate(xyz, voxel, budget)
+
+def box_corners(center, size, yaw):
+    # center (N, 2+), size (N, 3) as [w, l, h], yaw (N,) -> (N, 4, 2) corners
+    half_l = size[:, 1:2] / 2
+    half_w = size[:, 0:1] / 2
+    local_x = np.concatenate([half_l, half_l, -half_l, -half_l], axis=1)
+    local_y = np.concatenate([half_w, -half_w, -half_w, half_w], axis=1)
+    cos, sin = np.cos(yaw)[:, None], np.sin(yaw)[:, None]
+    xs = center[:, 0:1] + cos * local_x - sin * local_y
+    ys = center[:, 1:2] + sin * local_x + cos * local_y
+    return np.stack([xs, ys], axis=-1)
+
+def box_color_group(category_name):
+    for prefix in ["vehicle", "human", "animal"]:
+        if category_name.startswith(prefix):
+            return prefix
+    return "object"
+
+def render_nuscenes_scene(nusc_map, ego_traj):
+    # full render pipeline for a scene: map image, legend image, world<->pixel tf.
+    # Both figures are closed before returning; the images own their pixels.
+    fig, handles, labels, xmin, xmax, ymin, ymax = visualize_nuscenes_scene(nusc_map, ego_traj)
+    legend_fig = visualize_nuscenes_legends(handles, labels)
+    qimage = fig_to_qimage(fig)
+    my_tf = MyTF(xmin, xmax, ymin, ymax, qimage.width(), qimage.height())
+    qimage_legend = remove_qimage_margin(fig_to_qimage(legend_fig))
+    return qimage, qimage_legend, my_tf
+
 class MyTF:
     def __init__(self, xmin, xmax, ymin, ymax, pixmap_width, pixmap_height):
         self.xmin = xmin
@@ -128,6 +237,59 @@ class MyTF:
         y_world = -y_pixel * self.ratio + self.ymax
         return x_world, y_world
 
+def to_qpolygonf(xs, ys):
+    # fill the QPolygonF memory directly instead of building a list of QPointF
+    n = len(xs)
+    polygon = QPolygonF(n)
+    if n > 0:
+        ptr = polygon.data()
+        ptr.setsize(n * 2 * np.dtype(np.float64).itemsize)
+        buf = np.frombuffer(ptr, dtype=np.float64).reshape(n, 2)
+        buf[:, 0] = xs
+        buf[:, 1] = ys
+    return polygon
+
+class EgoTF:
+    # ego-centric version of MyTF: ego at the image center, heading pointing up
+    def __init__(self, ego_x, ego_y, ego_yaw, resolution, pixmap_width, pixmap_height):
+        self.ego_x = ego_x
+        self.ego_y = ego_y
+        self.cos = np.cos(ego_yaw)
+        self.sin = np.sin(ego_yaw)
+        self.ratio = resolution
+        self.pixmap_width = pixmap_width
+        self.pixmap_height = pixmap_height
+
+    def world_to_pixel(self, x_world, y_world):
+        dx, dy = x_world - self.ego_x, y_world - self.ego_y
+        forward = self.cos * dx + self.sin * dy
+        left = -self.sin * dx + self.cos * dy
+        x_pixel = self.pixmap_width / 2 - left / self.ratio
+        y_pixel = self.pixmap_height / 2 - forward / self.ratio
+        return x_pixel, y_pixel
+
+def rasterize_polyline(mask, xs_pixel, ys_pixel, thickness=1, value=255):
+    # draw a polyline into a (H, W) uint8 mask: densify to half-pixel steps, then stamp a disk
+    if len(xs_pixel) == 0:
+        return mask
+    pts = np.stack([xs_pixel, ys_pixel], axis=-1)
+    if pts.shape[0] > 1:
+        seg = np.diff(pts, axis=0)
+        n_sub = np.maximum(np.ceil(np.linalg.norm(seg, axis=1) * 2).astype(np.int64), 1)
+        seg_i = np.repeat(np.arange(seg.shape[0]), n_sub)
+        frac = (np.arange(n_sub.sum()) - np.repeat(np.cumsum(n_sub) - n_sub, n_sub)) / np.repeat(n_sub, n_sub)
+        pts = np.concatenate([pts[seg_i] + seg[seg_i] * frac[:, None], pts[-1:]], axis=0)
+    r = max(int(thickness) // 2, 0)
+    oy, ox = np.mgrid[-r:r + 1, -r:r + 1]
+    disk = (ox * ox + oy * oy) <= r * r
+    ox, oy = ox[disk], oy[disk]
+    px = (np.round(pts[:, 0]).astype(np.int64)[:, None] + ox).ravel()
+    py = (np.round(pts[:, 1]).astype(np.int64)[:, None] + oy).ravel()
+    h, w = mask.shape
+    valid = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+    mask[py[valid], px[valid]] = value
+    return mask
+
 class MyPainter:
     def __init__(self, qimage_cache):
         self.pixmap = QPixmap(qimage_cache)
@@ -147,13 +309,13 @@ class MyPainter:
         if pen is None:
             pen = QPen(color, stroke, Qt.SolidLine, cap=Qt.RoundCap)
         painter.setPen(pen)
-        points = [QPointF(xxx,yyy) for xxx,yyy in zip(xs_pixel, ys_pixel)]
-        painter.drawPolyline(points)
-        if arrow:
+        painter.drawPolyline(to_qpolygonf(xs_pixel, ys_pixel))
+        if arrow and len(xs_pixel) > 1:
             angle_half = np.pi/8
             r = 16
-            head = points[-1]       
-            angle = np.arctan2(ys_pixel[-3]-ys_pixel[-1], xs_pixel[-3]-xs_pixel[-1])
+            head = QPointF(xs_pixel[-1], ys_pixel[-1])
+            prev_i = max(-3, -len(xs_pixel))
+            angle = np.arctan2(ys_pixel[prev_i]-ys_pixel[-1], xs_pixel[prev_i]-xs_pixel[-1])
             left_tail = QPointF(
                 head.x() + r * np.cos(angle - angle_half), 
                 head.y() + r * np.sin(angle - angle_half)
@@ -165,8 +327,29 @@ class MyPainter:
             painter.drawPolyline([left_tail, head, right_tail])
         painter.end()
 
-    # TODO
+    def plot_points(self, xs_pixel, ys_pixel, color, stroke):
+        # one drawPoints call for the whole point set
+        painter = QPainter(self.pixmap)
+        painter.setPen(QPen(color, stroke, Qt.SolidLine, Qt.SquareCap))
+        painter.drawPoints(to_qpolygonf(xs_pixel, ys_pixel))
+        painter.end()
+
     def plot_a_rect(self, pts, color, stroke):
+        self.plot_rects(np.asarray(pts)[None], color, stroke)
+
+    def plot_rects(self, corners_pixel, color, stroke, fill=None, heading=True):
+        # corners_pixel: (N, 4, 2); all boxes go into one path and one draw call
+        path = QPainterPath()
+        for box in corners_pixel:
+            path.addPolygon(to_qpolygonf(box[[0, 1, 2, 3, 0], 0], box[[0, 1, 2, 3, 0], 1]))
+            if heading:
+                # mark the front edge: center -> middle of the front side
+                path.moveTo(box[:, 0].mean(), box[:, 1].mean())
+                path.lineTo((box[0, 0] + box[1, 0]) / 2, (box[0, 1] + box[1, 1]) / 2)
         painter = QPainter(self.pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(color, stroke, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+        painter.setBrush(QBrush(fill) if fill is not None else Qt.NoBrush)
+        painter.drawPath(path)
         painter.end()
 